@@ -0,0 +1,149 @@
+"""
+Bearer token verification.
+
+authenticate() turns an access token into a user id. Verified tokens are
+kept in a bounded LRU (AUTH_TOKEN_CACHE_SIZE) for at most
+AUTH_TOKEN_CACHE_TTL seconds, and never past the token's own exp, so a
+request normally costs a dict lookup instead of jwt.decode plus a User
+query. Logged-out tokens are remembered until they expire.
+
+The cache and the revocation list are per process: with several workers a
+revoked token stays valid on the others for up to AUTH_TOKEN_CACHE_TTL.
+
+AUTH_REQUIRED=1 makes the token mandatory for routers that depend on
+`authorize`; otherwise requests without one pass through as before, and a
+token that is sent must still be valid. Either way a token only grants
+access to its own user's `{user_id}` paths and rows (owns()).
+
+/admin/* routes depend on `require_admin`: the bearer token must be
+ADMIN_TOKEN, and with ADMIN_TOKEN unset they are closed.
+"""
+import os
+import secrets
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.database import async_engine
+from app.models import User
+from app.security import decode_access_token
+
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "0") == "1"
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "300"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+bearer = HTTPBearer(auto_error=False)
+
+
+class TokenCache:
+    def __init__(self, maxsize: int = AUTH_TOKEN_CACHE_SIZE, ttl: float = AUTH_TOKEN_CACHE_TTL) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # token -> (user_id, valid until)
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        # token -> exp
+        self._revoked: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[int]:
+        entry = self._entries.get(token)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                del self._entries[token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, token: str, user_id: int, exp: float) -> None:
+        self._entries[token] = (user_id, min(exp, time.time() + self.ttl))
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def revoke(self, token: str, exp: float) -> None:
+        self._entries.pop(token, None)
+        now = time.time()
+        # expired tokens fail jwt.decode anyway, no need to remember them
+        self._revoked = {t: e for t, e in self._revoked.items() if e > now}
+        self._revoked[token] = exp
+
+    def is_revoked(self, token: str) -> bool:
+        return token in self._revoked
+
+    def metrics(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "revoked": len(self._revoked),
+            "hits": self.hits,
+            "misses": self.misses,
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+        }
+
+
+token_cache = TokenCache()
+
+
+def _claims(token: str) -> dict:
+    try:
+        return decode_access_token(token)
+    except JWTError:
+        raise HTTPException(status_code=401, detail="invalid token", headers={"WWW-Authenticate": "Bearer"})
+
+
+async def authenticate(token: str) -> int:
+    """User id for a valid, unrevoked token; 401 otherwise."""
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
+    if token_cache.is_revoked(token):
+        raise HTTPException(status_code=401, detail="token revoked", headers={"WWW-Authenticate": "Bearer"})
+
+    claims = _claims(token)
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        user_id = (await session.exec(select(User.id).where(User.username == claims.get("sub")))).first()
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="unknown user", headers={"WWW-Authenticate": "Bearer"})
+
+    token_cache.put(token, user_id, float(claims["exp"]))
+    return user_id
+
+
+def revoke(token: str) -> None:
+    token_cache.revoke(token, float(_claims(token)["exp"]))
+
+
+def check_owner(user_id: Optional[int], path_user_id) -> None:
+    if user_id is not None and path_user_id is not None and int(path_user_id) != user_id:
+        raise HTTPException(status_code=403, detail="token belongs to another user")
+
+
+def owns(user_id: Optional[int], owner_id: int) -> bool:
+    """Whether the caller may touch a row of owner_id's; routes answer 404 otherwise, so ids can't be probed."""
+    return user_id is None or owner_id == user_id
+
+
+async def authorize(request: Request, creds: Optional[HTTPAuthorizationCredentials] = Depends(bearer)) -> Optional[int]:
+    """Router dependency: the caller's user id (None if anonymous and AUTH_REQUIRED is off)."""
+    if creds is None:
+        if AUTH_REQUIRED:
+            raise HTTPException(status_code=401, detail="not authenticated", headers={"WWW-Authenticate": "Bearer"})
+        return None
+    user_id = await authenticate(creds.credentials)
+    check_owner(user_id, request.path_params.get("user_id"))
+    return user_id
+
+
+def require_admin(creds: Optional[HTTPAuthorizationCredentials] = Depends(bearer)) -> None:
+    if not ADMIN_TOKEN or creds is None or not secrets.compare_digest(creds.credentials, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="admin only")
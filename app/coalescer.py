@@ -0,0 +1,75 @@
+"""
+Per-room debouncing for the time stream.
+
+The first message in a quiet room ticks immediately. Messages that arrive
+while that tick runs or within TIME_STREAM_WINDOW_MS after it are collected
+and folded into one follow-up tick, so engine/DB work tracks wall-clock time
+instead of how fast someone can press "Send". Ticks for one room never overlap.
+"""
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Hashable, List, Set
+
+TIME_STREAM_WINDOW_MS = int(os.getenv("TIME_STREAM_WINDOW_MS", "250"))
+
+logger = logging.getLogger(__name__)
+
+# tick(key, batch, tick_no); tick_no counts ticks per key, e.g. for seeding
+Tick = Callable[[Hashable, List[dict], int], Awaitable[None]]
+
+
+class TickCoalescer:
+    def __init__(self, tick: Tick, window_ms: int = TIME_STREAM_WINDOW_MS) -> None:
+        self.tick = tick
+        self.window = window_ms / 1000
+        self._pending: Dict[Hashable, List[dict]] = {}
+        self._runners: Dict[Hashable, asyncio.Task] = {}
+        self._tick_no: Dict[Hashable, int] = {}
+        # rooms that emptied while their runner was still going
+        self._forget: Set[Hashable] = set()
+        self.ticks = 0
+        self.messages = 0
+
+    def submit(self, key: Hashable, msg: dict) -> None:
+        self.messages += 1
+        self._forget.discard(key)
+        self._pending.setdefault(key, []).append(msg)
+        if key not in self._runners:
+            self._runners[key] = asyncio.create_task(self._run(key))
+
+    async def _run(self, key: Hashable) -> None:
+        try:
+            # keep ticking while messages keep arriving, at most one tick per window
+            while self._pending.get(key):
+                batch = self._pending.pop(key)
+                self.ticks += 1
+                tick_no = self._tick_no.get(key, 0)
+                self._tick_no[key] = tick_no + 1
+                try:
+                    await self.tick(key, batch, tick_no)
+                except Exception:
+                    logger.exception("time-stream tick failed for %s", key)
+                if self.window > 0:
+                    await asyncio.sleep(self.window)
+        finally:
+            self._runners.pop(key, None)
+            if key in self._forget:
+                self._forget.discard(key)
+                self._tick_no.pop(key, None)
+
+    def forget(self, key: Hashable) -> None:
+        """Drop a room's per-key state once its last socket has left (after any tick still running)."""
+        if key in self._runners:
+            self._forget.add(key)
+        else:
+            self._pending.pop(key, None)
+            self._tick_no.pop(key, None)
+
+    async def close(self) -> None:
+        for task in list(self._runners.values()):
+            task.cancel()
+        self._runners.clear()
+        self._pending.clear()
+        self._tick_no.clear()
+        self._forget.clear()
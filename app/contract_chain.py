@@ -0,0 +1,317 @@
+"""
+Temporal contract hash chain.
+
+Each contract stores prev_hash (the previous contract's hash on the same
+timeline, "" for the first) and
+contract_hash = sha256(f"{prev_hash}|{user_id}|{timeline_id}|{contract_text}").
+
+Appends go through append_contracts(): the chain head (last id + hash) of
+each timeline lives in ContractChainHead, and the insert only commits if a
+compare-and-swap on the head's last_id still matches what was read, so two
+concurrent appends can't both link to the same predecessor; the loser
+retries on the new head. With MERKLE_ENABLED the same transaction also
+extends the timeline's Merkle tree (see app/merkle.py).
+
+Verification is incremental: a ContractCheckpoint row per timeline records
+the last contract id whose link checked out and its hash, so a verify only
+rehashes contracts appended since. verify_all() checks every timeline, with
+the hashing spread over a process pool (CONTRACT_VERIFY_WORKERS) and at most
+CONTRACT_VERIFY_BATCH links per pool task loaded at a time. Hashing never
+runs inside the (BEGIN IMMEDIATE) transaction that loaded the links.
+
+    python -m app.contract_chain verify [--full]
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import merkle
+from app.etags import versions
+from app.models import ContractChainHead, ContractCheckpoint, TemporalContract, utcnow
+
+# 0 = os.cpu_count()
+CONTRACT_VERIFY_WORKERS = int(os.getenv("CONTRACT_VERIFY_WORKERS", "0")) or None
+# links per pool task in verify_all; small timelines share a task, long chains are split
+CONTRACT_VERIFY_BATCH = int(os.getenv("CONTRACT_VERIFY_BATCH", "5000"))
+# attempts before an append that keeps losing the head race gives up
+CONTRACT_APPEND_RETRIES = int(os.getenv("CONTRACT_APPEND_RETRIES", "5"))
+
+# (id, user_id, timeline_id, contract_text, prev_hash, contract_hash)
+Link = Tuple[int, int, int, str, str, str]
+# verify_links: (last good id or 0, its hash, links checked, first broken link or None)
+Result = Tuple[int, str, int, Optional[dict]]
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+class ChainConflict(Exception):
+    """The chain head kept moving under an append."""
+
+
+def compute_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def link_hash(prev_hash: str, user_id: int, timeline_id: int, contract_text: str) -> str:
+    return compute_hash(f"{prev_hash}|{user_id}|{timeline_id}|{contract_text}")
+
+
+def verify_links(links: Sequence[Link], prev_hash: str) -> Result:
+    """
+    Walk links (ordered by id) starting after a contract whose hash is prev_hash.
+    Returns (last good id or 0, its hash, links checked, first broken link or None).
+    Plain data in and out so it can run in a worker process.
+    """
+    good_id, good_hash = 0, prev_hash
+    for n, (cid, user_id, timeline_id, text, stored_prev, stored_hash) in enumerate(links):
+        expected = link_hash(good_hash, user_id, timeline_id, text)
+        if stored_prev != good_hash:
+            return good_id, good_hash, n + 1, {
+                "id": cid, "reason": "prev_hash mismatch", "expected": good_hash, "found": stored_prev,
+            }
+        if stored_hash != expected:
+            return good_id, good_hash, n + 1, {
+                "id": cid, "reason": "contract_hash mismatch", "expected": expected, "found": stored_hash,
+            }
+        good_id, good_hash = cid, stored_hash
+    return good_id, good_hash, len(links), None
+
+
+def verify_batch(jobs: Sequence[Tuple[Sequence[Link], str]]) -> List[Result]:
+    """verify_links over several (links, prev_hash) pairs in one pool task."""
+    return [verify_links(links, prev_hash) for links, prev_hash in jobs]
+
+
+async def _chain_head(session: AsyncSession, timeline_id: int) -> ContractChainHead:
+    query = (
+        select(ContractChainHead)
+        .where(ContractChainHead.timeline_id == timeline_id)
+        .execution_options(populate_existing=True)
+    )
+    head = (await session.exec(query)).first()
+    if head is not None:
+        return head
+
+    # first append since heads were introduced: seed from the newest contract
+    last = (await session.exec(
+        select(TemporalContract.id, TemporalContract.contract_hash)
+        .where(TemporalContract.timeline_id == timeline_id)
+        .order_by(TemporalContract.id.desc())
+        .limit(1)
+    )).first()
+    head = ContractChainHead(timeline_id=timeline_id, last_id=last[0] if last else 0, last_hash=last[1] if last else "")
+    try:
+        async with session.begin_nested():
+            session.add(head)
+    except IntegrityError:
+        # a concurrent append seeded it first
+        head = (await session.exec(query)).one()
+    return head
+
+
+async def append_contracts(session: AsyncSession, user_id: int, timeline_id: int, texts: Sequence[str]) -> List[TemporalContract]:
+    """Chain `texts` onto the timeline in one transaction; raises ChainConflict after CONTRACT_APPEND_RETRIES lost races."""
+    for _ in range(CONTRACT_APPEND_RETRIES):
+        head = await _chain_head(session, timeline_id)
+        expected_id, prev_hash = head.last_id, head.last_hash
+
+        contracts = []
+        for text in texts:
+            contract_hash = link_hash(prev_hash, user_id, timeline_id, text)
+            contracts.append(TemporalContract(
+                user_id=user_id,
+                timeline_id=timeline_id,
+                contract_text=text,
+                prev_hash=prev_hash,
+                contract_hash=contract_hash,
+            ))
+            prev_hash = contract_hash
+        session.add_all(contracts)
+        await session.flush()
+
+        swapped = await session.exec(
+            update(ContractChainHead)
+            .where(ContractChainHead.timeline_id == timeline_id, ContractChainHead.last_id == expected_id)
+            .values(last_id=contracts[-1].id, last_hash=prev_hash, updated_at=utcnow())
+        )
+        if swapped.rowcount == 1:
+            if merkle.MERKLE_ENABLED:
+                await merkle.append_leaves(session, timeline_id, contracts, expected_id)
+            await session.commit()
+            versions.bump(("contracts", timeline_id))
+            return contracts
+        # somebody appended since we read the head: drop our rows and relink on the new head
+        await session.rollback()
+    raise ChainConflict(f"timeline {timeline_id}: chain head kept changing")
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # not fork: a forked child would inherit the event loop, DB connections and threads of this process
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _pool = ProcessPoolExecutor(max_workers=CONTRACT_VERIFY_WORKERS, mp_context=multiprocessing.get_context(method))
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def _load(
+    session: AsyncSession, timeline_id: int, full: bool, limit: Optional[int] = None
+) -> Tuple[ContractCheckpoint, List[Link]]:
+    checkpoint = await session.get(ContractCheckpoint, timeline_id)
+    if checkpoint is None:
+        checkpoint = ContractCheckpoint(timeline_id=timeline_id)
+        session.add(checkpoint)
+    if full:
+        checkpoint.verified_up_to_id, checkpoint.verified_hash = 0, ""
+
+    links = (await session.exec(
+        select(
+            TemporalContract.id,
+            TemporalContract.user_id,
+            TemporalContract.timeline_id,
+            TemporalContract.contract_text,
+            TemporalContract.prev_hash,
+            TemporalContract.contract_hash,
+        )
+        .where(TemporalContract.timeline_id == timeline_id, TemporalContract.id > checkpoint.verified_up_to_id)
+        .order_by(TemporalContract.id)
+        .limit(limit)
+    )).all()
+    return checkpoint, [tuple(row) for row in links]
+
+
+def _record(checkpoint: ContractCheckpoint, result: Result) -> dict:
+    good_id, good_hash, checked, broken = result
+    if good_id:
+        # everything up to the first broken link is sound and won't be rehashed next time
+        checkpoint.verified_up_to_id, checkpoint.verified_hash = good_id, good_hash
+    checkpoint.updated_at = utcnow()
+    return {
+        "timeline_id": checkpoint.timeline_id,
+        "ok": broken is None,
+        "verified_up_to_id": checkpoint.verified_up_to_id,
+        "head_hash": checkpoint.verified_hash,
+        "checked": checked,
+        "broken": broken,
+    }
+
+
+async def verify_timeline(session: AsyncSession, timeline_id: int, full: bool = False) -> dict:
+    """Verify contracts appended since the checkpoint (all of them with full=True) and move it forward."""
+    checkpoint, links = await _load(session, timeline_id, full)
+    # don't hold the (BEGIN IMMEDIATE) transaction while the pool hashes
+    await session.commit()
+    result = await asyncio.get_running_loop().run_in_executor(get_pool(), verify_links, links, checkpoint.verified_hash)
+    report = _record(checkpoint, result)
+    await session.commit()
+    return report
+
+
+async def verify_all(session: AsyncSession, full: bool = False) -> List[dict]:
+    """
+    verify_timeline for every timeline with contracts, hashing in the process pool.
+    Works in rounds of one CONTRACT_VERIFY_BATCH sized task per pool worker: a chain
+    cut off by the batch size goes back in the queue and continues from its checkpoint.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    tasks_per_round = CONTRACT_VERIFY_WORKERS or os.cpu_count() or 1
+    todo: Deque[int] = deque()
+    last_timeline_id = 0
+    # timeline id -> links checked by earlier pieces
+    checked: Dict[int, int] = {}
+    reports: List[dict] = []
+
+    while True:
+        if not todo:
+            page = (await session.exec(
+                select(TemporalContract.timeline_id)
+                .where(TemporalContract.timeline_id > last_timeline_id)
+                .distinct()
+                .order_by(TemporalContract.timeline_id)
+                .limit(CONTRACT_VERIFY_BATCH)
+            )).all()
+            if not page:
+                break
+            todo.extend(page)
+            last_timeline_id = page[-1]
+
+        # (checkpoint, links, cut off by the batch size)
+        tasks: List[List[Tuple[ContractCheckpoint, List[Link], bool]]] = [[]]
+        room = CONTRACT_VERIFY_BATCH
+        while todo:
+            if room == 0:
+                if len(tasks) == tasks_per_round:
+                    break
+                tasks.append([])
+                room = CONTRACT_VERIFY_BATCH
+            timeline_id = todo.popleft()
+            checkpoint, links = await _load(session, timeline_id, full and timeline_id not in checked, limit=room)
+            checked.setdefault(timeline_id, 0)
+            tasks[-1].append((checkpoint, links, len(links) == room))
+            room -= len(links)
+        # don't hold the (BEGIN IMMEDIATE) transaction while the pool hashes
+        await session.commit()
+
+        results = await asyncio.gather(*(
+            loop.run_in_executor(pool, verify_batch, [(links, checkpoint.verified_hash) for checkpoint, links, _ in task])
+            for task in tasks
+        ))
+        done = []
+        for task, task_results in zip(tasks, results):
+            for (checkpoint, _, cut), result in zip(task, task_results):
+                report = _record(checkpoint, result)
+                if report["ok"] and cut:
+                    checked[checkpoint.timeline_id] += report["checked"]
+                    todo.append(checkpoint.timeline_id)
+                    continue
+                report["checked"] += checked.pop(checkpoint.timeline_id)
+                reports.append(report)
+                done.append(checkpoint)
+        await session.commit()
+        # finished timelines don't need to stay in the identity map
+        for checkpoint in done:
+            session.expunge(checkpoint)
+
+    return reports
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app.database import async_engine, async_write_engine, init_db
+
+    parser = argparse.ArgumentParser(description="Verify temporal contract hash chains")
+    parser.add_argument("command", choices=["verify"])
+    parser.add_argument("--full", action="store_true", help="ignore checkpoints and rehash every chain")
+    args = parser.parse_args()
+
+    async def _main() -> List[dict]:
+        async with AsyncSession(async_write_engine, expire_on_commit=False) as session:
+            reports = await verify_all(session, full=args.full)
+        await async_engine.dispose()
+        shutdown_pool()
+        return reports
+
+    init_db()
+    reports = asyncio.run(_main())
+    for r in reports:
+        if not r["ok"]:
+            print(f"timeline {r['timeline_id']}: broken at contract {r['broken']['id']} ({r['broken']['reason']})")
+    print(f"verified {len(reports)} timelines, {sum(not r['ok'] for r in reports)} broken")
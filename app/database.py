@@ -1,11 +1,117 @@
-from sqlmodel import SQLModel, create_engine, Session
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# env-driven engine profile; defaults match the old hard-coded local SQLite file
+DB_URL = os.getenv("DATABASE_URL", "sqlite:///./temporal_blackmail.db")
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# reads BEGIN DEFERRED: under WAL they never wait for a writer.
+# Write sessions (get_write_session / async_write_engine) BEGIN IMMEDIATE instead, taking the
+# write lock up front so busy_timeout applies rather than a read->write upgrade failing
+# straight away with "database is locked"
+SQLITE_BEGIN = os.getenv("SQLITE_BEGIN", "DEFERRED")
+SQLITE_WRITE_BEGIN = os.getenv("SQLITE_WRITE_BEGIN", "IMMEDIATE")
+
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def _async_url(url: URL) -> URL:
+    return url.set(drivername=_ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def _is_memory_sqlite(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def _engine_kwargs(url: URL) -> dict:
+    """Pool/connect settings per backend."""
+    kwargs = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    if url.get_backend_name() == "sqlite":
+        kwargs["connect_args"] = {"check_same_thread": False}
+    else:
+        kwargs["pool_pre_ping"] = True
+        kwargs["pool_recycle"] = DB_POOL_RECYCLE
+    return kwargs
+
+
+def _install_sqlite_profile(sync_engine) -> None:
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        # take over transaction control from the driver so we can issue our own BEGIN
+        dbapi_conn.isolation_level = None
+        cur = dbapi_conn.cursor()
+        cur.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cur.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cur.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.close()
+
+    @event.listens_for(sync_engine, "begin")
+    def _on_begin(conn):
+        conn.exec_driver_sql(f"BEGIN {conn.get_execution_options().get('sqlite_begin', SQLITE_BEGIN)}")
+
+
+def _make_engines(url_str: str):
+    url = make_url(url_str)
+    if _is_memory_sqlite(url):
+        # the sync and async drivers would each open their own, separate, empty database
+        raise ValueError("DATABASE_URL: in-memory SQLite isn't supported, use a file (e.g. sqlite:///./scratch.db)")
+    sync_engine = create_engine(url, echo=DB_ECHO, **_engine_kwargs(url))
+    aio_engine = create_async_engine(_async_url(url), echo=DB_ECHO, **_engine_kwargs(url))
+    if url.get_backend_name() == "sqlite":
+        _install_sqlite_profile(sync_engine)
+        _install_sqlite_profile(aio_engine.sync_engine)
+    return sync_engine, aio_engine
+
+
+engine, async_engine = _make_engines(DB_URL)
+# same pool, but transactions start with SQLITE_WRITE_BEGIN (a no-op option on other backends)
+async_write_engine = async_engine.execution_options(sqlite_begin=SQLITE_WRITE_BEGIN)
+
+
+# single-column indexes made redundant by the (user_id, id) / (timeline_id, id) composites in app/models.py
+OBSOLETE_INDEXES = ("ix_goal_user_id", "ix_timeline_user_id", "ix_temporalcontract_timeline_id")
 
-DB_URL = "sqlite:///./temporal_blackmail.db"
-engine = create_engine(DB_URL, echo=False)
 
 def init_db() -> None:
     SQLModel.metadata.create_all(engine)
+    # create_all skips tables that already exist, so indexes added to existing tables need their own pass
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    with engine.begin() as conn:
+        for name in OBSOLETE_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+
+
+async def get_async_session():
+    # expire_on_commit=False: expired attributes would trigger implicit IO, which async sessions can't do
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
 
-def get_session():
-    with Session(engine) as session:
+async def get_write_session():
+    """For routes that write: the transaction takes the SQLite write lock at BEGIN."""
+    async with AsyncSession(async_write_engine, expire_on_commit=False) as session:
         yield session
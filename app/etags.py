@@ -0,0 +1,123 @@
+"""
+ETags for the endpoints the dashboard polls.
+
+Every write to a polled resource bumps an in-memory version counter:
+
+    ("goals", user_id)          goal create / complete
+    ("contracts", timeline_id)  contract append
+    ("prison", user_id)         register, time-stream tick, scheduler lock/unlock
+
+GET handlers call `conditional()` before touching the database: the ETag
+is derived from the counter (plus the query string, for paginated lists),
+so a matching If-None-Match gets a 304 straight away.
+
+Tags carry a per-process epoch, so a restarted process (or another worker)
+never answers 304 to a tag it didn't issue. With a shared WS broker, bumps
+are also published on ETAG_ROOM so every worker moves its counter for
+writes made elsewhere; with memory:// there is only this process, so
+startup turns ETags off when it sees several workers (worker_count()).
+"""
+import asyncio
+import logging
+import os
+import secrets
+import sys
+import zlib
+from typing import Awaitable, Callable, Dict, Hashable, Mapping, Optional, Sequence, Set, Tuple
+
+from fastapi import Request, Response
+
+from app.json_codec import dumps, loads
+
+ETAG_ROOM = "__etags__"
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, int]
+
+
+class VersionTable:
+    def __init__(self) -> None:
+        self.epoch = secrets.token_hex(4)
+        # off: conditional() neither sends ETags nor answers 304
+        self.enabled = True
+        self.versions: Dict[Hashable, int] = {}
+        self._publish: Optional[Callable[[str], Awaitable[None]]] = None
+        # announcements in flight, referenced until done
+        self._announcing: Set[asyncio.Task] = set()
+
+    def set_publisher(self, publish: Optional[Callable[[str], Awaitable[None]]]) -> None:
+        """Where bumps are announced to other workers (None: single process)."""
+        self._publish = publish
+
+    def bump(self, *keys: Key) -> None:
+        for key in keys:
+            self.versions[key] = self.versions.get(key, 0) + 1
+        if self._publish is not None and keys:
+            frame = dumps({"origin": self.epoch, "keys": [list(k) for k in keys]})
+            task = asyncio.get_running_loop().create_task(self._announce(frame))
+            self._announcing.add(task)
+            task.add_done_callback(self._announcing.discard)
+
+    async def close(self) -> None:
+        """Wait for announcements in flight (before the broker goes away)."""
+        if self._announcing:
+            await asyncio.gather(*self._announcing, return_exceptions=True)
+
+    async def _announce(self, frame: str) -> None:
+        try:
+            await self._publish(frame)
+        except Exception:
+            logger.exception("etag bump publish failed")
+
+    def apply_remote(self, frame: str) -> None:
+        message = loads(frame)
+        if message["origin"] == self.epoch:
+            return
+        for kind, ident in message["keys"]:
+            key = (kind, ident)
+            self.versions[key] = self.versions.get(key, 0) + 1
+
+    def etag(self, key: Key, variant: str = "") -> str:
+        tag = f"{self.epoch}.{self.versions.get(key, 0)}"
+        if variant:
+            tag += f".{zlib.crc32(variant.encode('utf-8')):08x}"
+        return f'W/"{tag}"'
+
+
+versions = VersionTable()
+
+
+def worker_count(argv: Sequence[str] = sys.argv, environ: Mapping[str, str] = os.environ) -> int:
+    """
+    Server processes sharing this app, as far as this one can tell: WEB_CONCURRENCY /
+    UVICORN_WORKERS, or --workers / -w on the command line (uvicorn and gunicorn
+    workers inherit the supervisor's argv).
+    """
+    counts = [environ.get("WEB_CONCURRENCY"), environ.get("UVICORN_WORKERS")]
+    for n, arg in enumerate(argv):
+        if arg in ("--workers", "-w") and n + 1 < len(argv):
+            counts.append(argv[n + 1])
+        elif arg.startswith("--workers="):
+            counts.append(arg.split("=", 1)[1])
+    return max([int(c) for c in counts if c and c.isdigit()] or [1])
+
+
+def _matches(if_none_match: Optional[str], tag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {t.strip() for t in if_none_match.split(",")}
+    # weak comparison: W/"x" and "x" are the same tag
+    return "*" in candidates or tag in candidates or tag[2:] in candidates
+
+
+def conditional(request: Request, response: Response, key: Key) -> Optional[Response]:
+    """304 response if the client's copy is current; otherwise sets ETag on `response` and returns None."""
+    if not versions.enabled:
+        return None
+    tag = versions.etag(key, request.url.query)
+    if _matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers={"ETag": tag, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = "no-cache"
+    return None
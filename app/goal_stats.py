@@ -0,0 +1,108 @@
+"""
+Per-user goal counters.
+
+The time-stream loop needs total/completed/incomplete for a user on every
+message. Instead of loading every Goal row, the goals router keeps a
+GoalStats row up to date in the same transaction as the goal write.
+
+Existing databases can be repaired with:
+    python -m app.goal_stats rebuild
+"""
+from sqlalchemy import case, func, update, delete
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.database import async_write_engine
+from app.models import Goal, GoalStats
+
+
+def _completed_count():
+    # SUM over a boolean column only works on SQLite; Postgres has no sum(boolean)
+    return func.coalesce(func.sum(case((Goal.completed, 1), else_=0)), 0)
+
+
+async def _count_goals(session: AsyncSession, user_id: int) -> tuple[int, int]:
+    result = await session.exec(
+        select(func.count(Goal.id), _completed_count())
+        .where(Goal.user_id == user_id)
+    )
+    total, completed = result.one()
+    return int(total), int(completed)
+
+
+async def get_goal_stats(session: AsyncSession, user_id: int) -> GoalStats:
+    """
+    O(1) lookup of a user's counters; register creates the row.
+    Users that predate the counters are backfilled on first read, which writes:
+    pass a write session (see read_goal_stats for read paths).
+    """
+    stats = await session.get(GoalStats, user_id, populate_existing=True)
+    if stats is None:
+        total, completed = await _count_goals(session, user_id)
+        stats = GoalStats(user_id=user_id, total=total, completed=completed)
+        session.add(stats)
+        await session.flush()
+    return stats
+
+
+async def read_goal_stats(session: AsyncSession, user_id: int) -> GoalStats:
+    """
+    get_goal_stats for read-only sessions: a missing row (user older than the
+    counters) is backfilled in a short write transaction of its own, so the
+    read transaction never upgrades to a write.
+    """
+    stats = await session.get(GoalStats, user_id, populate_existing=True)
+    if stats is not None:
+        return stats
+    async with AsyncSession(async_write_engine, expire_on_commit=False) as write_session:
+        stats = await get_goal_stats(write_session, user_id)
+        await write_session.commit()
+    return stats
+
+
+async def bump_goal_stats(session: AsyncSession, user_id: int, total: int = 0, completed: int = 0) -> None:
+    """
+    Atomic in-database increment; the caller commits.
+    Call it before adding/modifying the Goal so a backfill doesn't count the change twice.
+    """
+    await get_goal_stats(session, user_id)
+    await session.exec(
+        update(GoalStats)
+        .where(GoalStats.user_id == user_id)
+        .values(total=GoalStats.total + total, completed=GoalStats.completed + completed)
+    )
+
+
+async def rebuild_goal_stats(session: AsyncSession) -> int:
+    """Recompute every user's counters from the goal table in one grouped pass."""
+    result = await session.exec(
+        select(Goal.user_id, func.count(Goal.id), _completed_count())
+        .group_by(Goal.user_id)
+    )
+    rows = result.all()
+
+    await session.exec(delete(GoalStats))
+    for user_id, total, completed in rows:
+        session.add(GoalStats(user_id=user_id, total=int(total), completed=int(completed)))
+    await session.commit()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+
+    from app.database import async_engine, init_db
+
+    parser = argparse.ArgumentParser(description="Maintain per-user goal counters")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+
+    async def _main() -> int:
+        async with AsyncSession(async_write_engine) as session:
+            n = await rebuild_goal_stats(session)
+        await async_engine.dispose()
+        return n
+
+    init_db()
+    print(f"rebuilt goal stats for {asyncio.run(_main())} users")
@@ -0,0 +1,53 @@
+"""
+JSON encoding shared by WebSocket broadcasts and HTTP responses.
+
+Uses orjson or msgspec when installed (both several times faster than the
+stdlib for our payloads), otherwise falls back to `json` with the same
+compact format Starlette uses. JSON_BACKEND=orjson|msgspec|json forces one.
+"""
+import json
+import os
+from typing import Any, Callable
+
+from fastapi.responses import JSONResponse
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def _load_backend(name: str) -> tuple[Callable[[Any], bytes], Callable[[Any], Any]]:
+    if name == "orjson":
+        import orjson
+        return orjson.dumps, orjson.loads
+    if name == "msgspec":
+        import msgspec
+        return msgspec.json.Encoder().encode, msgspec.json.Decoder().decode
+    return _stdlib_dumps, json.loads
+
+
+def _pick_backend() -> tuple[str, Callable[[Any], bytes], Callable[[Any], Any]]:
+    forced = os.getenv("JSON_BACKEND")
+    if forced:
+        return (forced, *_load_backend(forced))
+    for name in ("orjson", "msgspec"):
+        try:
+            return (name, *_load_backend(name))
+        except ImportError:
+            continue
+    return "json", _stdlib_dumps, json.loads
+
+
+JSON_BACKEND, dumps_bytes, loads = _pick_backend()
+
+
+def dumps(obj: Any) -> str:
+    """Encode to text (for WebSocket text frames)."""
+    return dumps_bytes(obj).decode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the selected backend."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
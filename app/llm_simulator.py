@@ -1,5 +1,11 @@
+import abc
+import asyncio
 import json
+import math
+import os
 import random
+from functools import lru_cache
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional, Set, Tuple
 
 TIMESELF_STYLES = {
     "PAST": [
@@ -20,35 +26,253 @@ TIMESELF_STYLES = {
 }
 
 
-def degrade_text(text: str, corruption: float) -> str:
-    """Corruption -> nonsense."""
-    if corruption <= 0:
-        return text
+NOISE_TOKENS = ("???", "##", "ERROR", "VOID", "▒▒▒")
+
+# distinct renderings per (self, context, corruption bucket); the rng only picks which one
+SIMULATOR_VARIANTS = int(os.getenv("SIMULATOR_VARIANTS", "64"))
+SIMULATOR_CACHE_SIZE = int(os.getenv("SIMULATOR_CACHE_SIZE", "4096"))
+# corruption is rounded to this step before rendering so nearby values share cache entries
+CORRUPTION_STEP = 0.05
+
+# pre-tokenized once at import: degrade works on word tuples instead of re-splitting strings
+STYLE_WORDS = {k: tuple(tuple(line.split()) for line in lines) for k, lines in TIMESELF_STYLES.items()}
 
-    words = text.split()
+FUTURE_COLLAPSE = tuple("Your timeline is collapsing. Keep ignoring me.".split())
+FUTURE_CONTRACT = tuple("Also: you still haven't fulfilled your temporal contract.".split())
+PAST_TEMPLATE = "I left {} unfinished goals behind.".format
+PRESENT_TEMPLATE = "Current stability: {:.2f}".format
+
+
+def _degrade_words(words: Tuple[str, ...], corruption: float, rng) -> str:
+    if corruption <= 0:
+        return " ".join(words)
+    words = list(words)
     k = max(1, int(len(words) * corruption))
     for _ in range(k):
-        idx = random.randint(0, len(words) - 1)
-        words[idx] = random.choice(["???", "##", "ERROR", "VOID", "▒▒▒"])
+        idx = rng.randint(0, len(words) - 1)
+        words[idx] = rng.choice(NOISE_TOKENS)
     return " ".join(words)
 
 
-def simulate_time_self(time_self: str, context: dict, corruption: float = 0.0) -> str:
-    """
-    A stand-in for real LLM.
-    Context includes goals, contracts, stability, etc.
-    """
-    base = random.choice(TIMESELF_STYLES[time_self])
+def degrade_text(text: str, corruption: float, rng: Optional[random.Random] = None) -> str:
+    """Corruption -> nonsense."""
+    if corruption <= 0:
+        return text
+    return _degrade_words(tuple(text.split()), corruption, rng or random)
+
+
+def _context_key(time_self: str, context: dict) -> tuple:
+    """Only the parts of the context the template for `time_self` actually renders."""
+    if time_self == "FUTURE":
+        return (context.get("stability", 1.0) < 0.5, context.get("open_contracts", 0) > 0)
+    if time_self == "PAST":
+        return (context.get("unfinished_goals", 0),)
+    if time_self == "PRESENT":
+        return (PRESENT_TEMPLATE(context.get("stability", 1.0)),)
+    return ()
+
+
+@lru_cache(maxsize=SIMULATOR_CACHE_SIZE)
+def _render(time_self: str, ctx_key: tuple, corruption_bucket: int, seed: int) -> str:
+    rng = random.Random(seed)
+    words = rng.choice(STYLE_WORDS[time_self])
 
     # add context spice
     if time_self == "FUTURE":
-        if context.get("stability", 1.0) < 0.5:
-            base += " Your timeline is collapsing. Keep ignoring me."
-        if context.get("open_contracts", 0) > 0:
-            base += " Also: you still haven't fulfilled your temporal contract."
+        collapsing, open_contracts = ctx_key
+        if collapsing:
+            words += FUTURE_COLLAPSE
+        if open_contracts:
+            words += FUTURE_CONTRACT
     if time_self == "PAST":
-        base += f" I left {context.get('unfinished_goals', 0)} unfinished goals behind."
+        words += tuple(PAST_TEMPLATE(ctx_key[0]).split())
     if time_self == "PRESENT":
-        base += f" Current stability: {context.get('stability', 1.0):.2f}"
+        words += tuple(ctx_key[0].split())
+
+    return _degrade_words(words, corruption_bucket * CORRUPTION_STEP, rng)
+
+
+def simulate_time_self(time_self: str, context: dict, corruption: float = 0.0, rng: Optional[random.Random] = None) -> str:
+    """
+    A stand-in for real LLM.
+    Context includes goals, contracts, stability, etc.
+    Pass `rng` for reproducible output.
+
+    Renders are cached per (self, rendered context, corruption bucket, variant seed),
+    so repeated states return the same string object without re-tokenizing.
+    """
+    seed = (rng or random).randrange(SIMULATOR_VARIANTS)
+    # round up, so any corruption at all degrades the text (the inner round() absorbs float noise like 0.1 / 0.05)
+    bucket = max(1, math.ceil(round(corruption / CORRUPTION_STEP, 6))) if corruption > 0 else 0
+    return _render(time_self, _context_key(time_self, context), bucket, seed)
+
+
+# words per time_self_delta chunk when streaming
+STREAM_CHUNK_WORDS = int(os.getenv("STREAM_CHUNK_WORDS", "4"))
+
+
+def chunk_text(text: str, words_per_chunk: int = STREAM_CHUNK_WORDS) -> Iterator[str]:
+    """Split into chunks whose concatenation is exactly `text`."""
+    words = text.split(" ")
+    for i in range(0, len(words), words_per_chunk):
+        chunk = " ".join(words[i:i + words_per_chunk])
+        yield chunk if i == 0 else " " + chunk
+
+
+def stream_time_self(time_self: str, context: dict, corruption: float = 0.0, rng: Optional[random.Random] = None) -> Iterator[str]:
+    """Generator variant of simulate_time_self, yielding the message a few words at a time."""
+    yield from chunk_text(simulate_time_self(time_self, context, corruption, rng))
+
+
+# ---------------------------------------------------------------------------
+# Async providers: the simulator above, or a real HTTP LLM endpoint
+# ---------------------------------------------------------------------------
+
+# unset = local simulator; otherwise base URL of a server speaking POST /generate_batch (see app/llm_stub.py)
+LLM_BACKEND_URL = os.getenv("LLM_BACKEND_URL")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "2.0"))
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "10"))
+LLM_BATCH_MAX = int(os.getenv("LLM_BATCH_MAX", "32"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+
+
+class LLMProvider(abc.ABC):
+    @abc.abstractmethod
+    async def generate(self, time_self: str, context: dict, corruption: float = 0.0, rng: Optional[random.Random] = None) -> str:
+        ...
+
+    async def stream(self, time_self: str, context: dict, corruption: float = 0.0, rng: Optional[random.Random] = None) -> AsyncIterator[str]:
+        """Default: generate the whole message, then hand it out in chunks."""
+        for chunk in chunk_text(await self.generate(time_self, context, corruption, rng)):
+            yield chunk
+
+    async def close(self) -> None:
+        pass
+
+
+class SimulatorProvider(LLMProvider):
+    async def generate(self, time_self: str, context: dict, corruption: float = 0.0, rng: Optional[random.Random] = None) -> str:
+        return simulate_time_self(time_self, context, corruption, rng)
+
+    async def stream(self, time_self: str, context: dict, corruption: float = 0.0, rng: Optional[random.Random] = None) -> AsyncIterator[str]:
+        for chunk in stream_time_self(time_self, context, corruption, rng):
+            yield chunk
+            # let the other selves' streams interleave with this one
+            await asyncio.sleep(0)
+
+
+class HTTPProvider(LLMProvider):
+    """
+    Requests from every room are queued and sent together: a batch goes out when
+    LLM_BATCH_MAX requests are waiting or LLM_BATCH_WINDOW_MS after the first one.
+    A call that doesn't get its answer within LLM_TIMEOUT falls back to the simulator.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        timeout: float = LLM_TIMEOUT,
+        window_ms: float = LLM_BATCH_WINDOW_MS,
+        max_batch: int = LLM_BATCH_MAX,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+    ) -> None:
+        import httpx
+
+        self.timeout = timeout
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        # one pooled client for the process, keep-alive connections are reused across batches
+        self.client = httpx.AsyncClient(
+            base_url=url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self._queue: list = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # batches in flight; the loop only keeps weak references to tasks
+        self._sends: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.fallbacks = 0
+
+    async def generate(self, time_self: str, context: dict, corruption: float = 0.0, rng: Optional[random.Random] = None) -> str:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._queue.append(({"self": time_self, "context": context, "corruption": corruption}, fut))
+        if len(self._queue) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), self.timeout)
+        except Exception:
+            self.fallbacks += 1
+            return simulate_time_self(time_self, context, corruption, rng)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._queue = self._queue, []
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+
+    async def _send(self, batch: list) -> None:
+        self.batches += 1
+        try:
+            r = await self.client.post("/generate_batch", json={"requests": [req for req, _ in batch]})
+            r.raise_for_status()
+            outputs = r.json()["outputs"]
+            for (_, fut), text in zip(batch, outputs):
+                if not fut.done():
+                    fut.set_result(text)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+                    # callers that already timed out never retrieve it
+                    fut.exception()
+
+    async def close(self) -> None:
+        self._flush()
+        if self._sends:
+            await asyncio.gather(*self._sends, return_exceptions=True)
+        await self.client.aclose()
+
+
+def make_provider(url: Optional[str] = LLM_BACKEND_URL) -> LLMProvider:
+    return HTTPProvider(url) if url else SimulatorProvider()
+
+
+# more corruption the further from the present
+SELF_CORRUPTION = {"PAST": 0.3, "PRESENT": 0.1, "FUTURE": 0.6}
+
+
+async def generate_selves(provider: LLMProvider, context: dict, corruption: float, rng: Optional[random.Random] = None) -> dict:
+    """PAST/PRESENT/FUTURE concurrently."""
+    texts = await asyncio.gather(*(
+        provider.generate(who, context, corruption * factor, rng) for who, factor in SELF_CORRUPTION.items()
+    ))
+    return dict(zip(SELF_CORRUPTION, texts))
+
+
+async def stream_selves(
+    provider: LLMProvider,
+    context: dict,
+    corruption: float,
+    on_chunk: Callable[[str, str], Awaitable[None]],
+    rng: Optional[random.Random] = None,
+) -> dict:
+    """Like generate_selves, but calls on_chunk(self, chunk) as each piece is produced."""
+
+    async def one(who: str, factor: float) -> str:
+        parts = []
+        async for chunk in provider.stream(who, context, corruption * factor, rng):
+            parts.append(chunk)
+            await on_chunk(who, chunk)
+        return "".join(parts)
 
-    return degrade_text(base, corruption)
+    texts = await asyncio.gather(*(one(who, factor) for who, factor in SELF_CORRUPTION.items()))
+    return dict(zip(SELF_CORRUPTION, texts))
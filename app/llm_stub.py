@@ -0,0 +1,37 @@
+"""
+Local stand-in for an HTTP LLM server, speaking the protocol HTTPProvider uses.
+
+    uvicorn app.llm_stub:app --port 8100
+    LLM_BACKEND_URL=http://127.0.0.1:8100 uvicorn app.main:app
+
+LLM_STUB_LATENCY_MS adds an artificial per-batch delay for timeout/batching tests.
+"""
+import asyncio
+import os
+from typing import List
+
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+from app.llm_simulator import simulate_time_self
+
+LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "0"))
+
+app = FastAPI(title="Temporal Blackmail - LLM stub")
+
+
+class GenerateRequest(BaseModel):
+    self: str
+    context: dict = {}
+    corruption: float = 0.0
+
+
+class GenerateBatch(BaseModel):
+    requests: List[GenerateRequest]
+
+
+@app.post("/generate_batch")
+async def generate_batch(payload: GenerateBatch):
+    if LLM_STUB_LATENCY_MS:
+        await asyncio.sleep(LLM_STUB_LATENCY_MS / 1000)
+    return {"outputs": [simulate_time_self(r.self, r.context, r.corruption) for r in payload.requests]}
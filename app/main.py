@@ -1,30 +1,79 @@
 import json
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends
-from sqlmodel import Session, select
+import logging
+import os
+from typing import Optional
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Request, Response
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.database import init_db, get_session
-from app.models import Goal, Timeline, TemporalContract, TimePrison
-from app.llm_simulator import simulate_time_self
-from app.temporal_engine import predict_failure, update_stability, should_lock_prison
-from app.ws_manager import WSManager
+from app.auth_tokens import AUTH_REQUIRED, authenticate, authorize, check_owner, require_admin, token_cache
+from app.etags import ETAG_ROOM, conditional, versions, worker_count
+from app.database import init_db, get_async_session, get_write_session, async_engine, async_write_engine
+from app.goal_stats import read_goal_stats
+from app.json_codec import FastJSONResponse
+from app.models import Timeline, TemporalContract, TimePrison
+from app.llm_simulator import generate_selves, make_provider, stream_selves
+from app.temporal_engine import predict_failure, update_stability, should_lock_prison, tick_rng
+from app.coalescer import TickCoalescer
+from app.contract_chain import shutdown_pool, verify_all
+from app.password_hasher import password_hasher
+from app.scheduler import StabilityScheduler
+from app.ws_broker import InMemoryBroker
+from app.ws_manager import CLOSE_POLICY_VIOLATION, WSManager
+from app.write_behind import write_buffer
 
 from app.routes.auth import router as auth_router
 from app.routes.goals import router as goals_router
 from app.routes.contracts import router as contracts_router
 from app.routes.timelines import router as timelines_router
+from app.routes.engine import router as engine_router
 
-app = FastAPI(title="Temporal Blackmail - Time Crime Backend")
+# stream time-self messages as time_self_delta frames before the final state frame, which then leaves them out
+STREAM_SELVES = os.getenv("STREAM_SELVES", "1") == "1"
+# send time_stream_snapshot/time_stream_delta frames (app/room_state.py) instead of a full time_stream_update per tick
+WS_STATE_DELTAS = os.getenv("WS_STATE_DELTAS", "1") == "1"
+
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="Temporal Blackmail - Time Crime Backend", default_response_class=FastJSONResponse)
 manager = WSManager()
+scheduler = StabilityScheduler(async_write_engine, write_buffer)
+llm = make_provider()
 
 app.include_router(auth_router)
 app.include_router(goals_router)
 app.include_router(contracts_router)
 app.include_router(timelines_router)
+app.include_router(engine_router)
 
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     init_db()
+    write_buffer.start()
+    await manager.start()
+    if not isinstance(manager.broker, InMemoryBroker):
+        # other workers' writes must move our ETag versions too
+        await manager.add_control_room(ETAG_ROOM, versions.apply_remote)
+        versions.set_publisher(lambda frame: manager.broker.publish(ETAG_ROOM, frame))
+    elif worker_count() > 1:
+        # a worker that missed a write elsewhere would keep answering 304
+        versions.enabled = False
+        logger.error("ETags disabled: workers can't share versions over WS_BROKER_URL=memory://, use redis:// or unix://")
+    scheduler.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await scheduler.stop()
+    await coalescer.close()
+    await write_buffer.stop()
+    await versions.close()
+    await manager.close()
+    await llm.close()
+    shutdown_pool()
+    password_hasher.close()
+    await async_engine.dispose()
 
 
 @app.get("/")
@@ -32,116 +81,215 @@ def root():
     return {"status": "Temporal Blackmail backend alive"}
 
 
-@app.get("/prison/{user_id}")
-def prison_state(user_id: int, session: Session = Depends(get_session)):
-    prison = session.exec(select(TimePrison).where(TimePrison.user_id == user_id)).first()
+@app.get("/admin/ws-metrics", dependencies=[Depends(require_admin)])
+def ws_metrics():
+    return manager.metrics()
+
+
+@app.get("/admin/password-hasher", dependencies=[Depends(require_admin)])
+def password_hasher_metrics():
+    return password_hasher.metrics()
+
+
+@app.get("/admin/scheduler", dependencies=[Depends(require_admin)])
+def scheduler_metrics():
+    return scheduler.metrics()
+
+
+@app.get("/admin/auth-cache", dependencies=[Depends(require_admin)])
+def auth_cache_metrics():
+    return token_cache.metrics()
+
+
+@app.get("/admin/contracts/verify", dependencies=[Depends(require_admin)])
+async def verify_all_contracts(full: bool = False, session: AsyncSession = Depends(get_write_session)):
+    """Verify every timeline's chain (hashing in a process pool); full=true rehashes everything."""
+    reports = await verify_all(session, full=full)
+    return {"ok": all(r["ok"] for r in reports), "timelines": reports}
+
+
+@app.get("/prison/{user_id}", dependencies=[Depends(authorize)])
+async def prison_state(user_id: int, request: Request, response: Response, session: AsyncSession = Depends(get_async_session)):
+    not_modified = conditional(request, response, ("prison", user_id))
+    if not_modified is not None:
+        return not_modified
+
+    prison = (await session.exec(select(TimePrison).where(TimePrison.user_id == user_id))).first()
+    pending = write_buffer.prison_state(user_id)
+    if pending is not None:
+        prison = TimePrison(id=prison.id if prison else None, user_id=user_id, **pending)
     return prison
 
 
+async def time_stream_tick(key: tuple, batch: list, tick_no: int = 0):
+    """
+    One engine tick for a room, covering every message in `batch`.
+    With TEMPORAL_SEED set, all randomness comes from a (user, timeline, tick_no) seeded RNG.
+    """
+    user_id, timeline_id = key
+    room = f"user:{user_id}:timeline:{timeline_id}"
+    rng = tick_rng(user_id, timeline_id, tick_no)
+
+    # fetch data: a short-lived session per tick, so idle sockets don't pin a DB connection
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        stats = await read_goal_stats(session, user_id)
+        timeline = await session.get(Timeline, timeline_id)
+        contracts = (await session.exec(select(TemporalContract).where(TemporalContract.timeline_id == timeline_id))).all()
+        prison = (await session.exec(select(TimePrison).where(TimePrison.user_id == user_id))).first()
+        # read-only: end the transaction now, writes go through write_buffer
+        await session.commit()
+
+    # unflushed state from earlier messages wins over the database
+    stability = write_buffer.timeline_stability(timeline_id, timeline.stability)
+    pending = write_buffer.prison_state(user_id)
+    if pending is None and prison is not None:
+        pending = {"locked": prison.locked, "reason": prison.reason, "unlock_condition": prison.unlock_condition}
+    # plain copy to mutate; state is persisted through write_buffer, never via the ORM row
+    prison = TimePrison(user_id=user_id, **(pending or {}))
+
+    completed = stats.completed
+    total = stats.total
+    ratio = completed / max(1, total)
+
+    # prediction
+    pred = predict_failure(total, ratio)
+
+    # ✅ ignored warning logic:
+    # If user sends messages while having incomplete goals => timeline destabilizes
+    incomplete = stats.incomplete
+    ignored_warnings = 0
+
+    if incomplete > 0:
+        # more incomplete goals => higher ignored warnings, one batch of them per folded message
+        ignored_warnings = min(5, 1 + incomplete // 3) * len(batch)
+
+    # ✅ update stability based on behavior (completed credit also scales with the batch)
+    stability = update_stability(
+        current=stability,
+        ignored_warnings=ignored_warnings,
+        completed_tasks=completed * len(batch),
+        rng=rng,
+    )
+
+    # prison check
+    # lock if timeline unstable + prediction says high fail chance
+    if should_lock_prison(stability, pred.will_fail_probability):
+        prison.locked = True
+        prison.reason = "Future You has declared you a temporal liability."
+        prison.unlock_condition = "Complete at least 1 goal to restore the timeline."
+    else:
+        # unlock automatically if at least one task completed
+        if completed > 0:
+            prison.locked = False
+            prison.reason = ""
+            prison.unlock_condition = ""
+
+    # persist (batched, see app/write_behind.py)
+    write_buffer.put_timeline(timeline_id, stability)
+    write_buffer.put_prison(user_id, prison.locked, prison.reason, prison.unlock_condition)
+    versions.bump(("prison", user_id))
+
+    # context for time-selves
+    context = {
+        "stability": stability,
+        "unfinished_goals": incomplete,
+        "open_contracts": len(contracts),
+        "prediction": pred.will_fail_probability,
+    }
+
+    # memory corruption increases as stability decreases
+    corruption = max(0.0, 1.0 - stability)
+
+    # simulate time selves (concurrently, batched with other rooms when a real backend is configured)
+    if STREAM_SELVES:
+        async def send_chunk(who: str, chunk: str):
+            await manager.broadcast(room, {"type": "time_self_delta", "self": who, "chunk": chunk})
+
+        selves = await stream_selves(llm, context, corruption, send_chunk, rng)
+    else:
+        selves = await generate_selves(llm, context, corruption, rng)
+
+    state = {
+        "timeline": {
+            "id": timeline.id,
+            "name": timeline.name,
+            "stability": stability,
+            "prediction_fail_prob": pred.will_fail_probability,
+            "prediction_reason": pred.reason,
+            "ignored_warnings": ignored_warnings,
+            "incomplete_goals": incomplete,
+        },
+        "prison": {
+            "locked": prison.locked,
+            "reason": prison.reason,
+            "unlock_condition": prison.unlock_condition,
+        },
+    }
+    # streamed selves already reached the room as time_self_delta frames
+    if not STREAM_SELVES:
+        state["selves"] = [
+            {"self": "PAST", "message": selves["PAST"]},
+            {"self": "PRESENT", "message": selves["PRESENT"]},
+            {"self": "FUTURE", "message": selves["FUTURE"]},
+        ]
+    if WS_STATE_DELTAS:
+        await manager.publish_state(room, state)
+    else:
+        await manager.broadcast(room, {"type": "time_stream_update", **state})
+
+
+coalescer = TickCoalescer(time_stream_tick)
+
+
 @app.websocket("/ws/time-stream/{user_id}/{timeline_id}")
-async def time_stream(ws: WebSocket, user_id: int, timeline_id: int, session: Session = Depends(get_session)):
+async def time_stream(ws: WebSocket, user_id: int, timeline_id: int, token: Optional[str] = None):
     """
     Live 3-way chat among Past/Present/Future.
     Timeline stability drops if user keeps talking without completing tasks.
     Eventually triggers TIME PRISON.
+    The token (?token=...) and the timeline's owner are checked once here, not per message.
     """
+    try:
+        if token:
+            check_owner(await authenticate(token), user_id)
+        elif AUTH_REQUIRED:
+            raise HTTPException(status_code=401, detail="not authenticated")
+        async with AsyncSession(async_engine) as session:
+            owner = (await session.exec(select(Timeline.user_id).where(Timeline.id == timeline_id))).first()
+        # the room is keyed by the path user, so a foreign timeline would let one user drive another's stability
+        if owner != user_id:
+            raise HTTPException(status_code=404, detail="timeline not found")
+    except HTTPException as e:
+        await ws.close(code=CLOSE_POLICY_VIOLATION, reason=e.detail)
+        return
+
     room = f"user:{user_id}:timeline:{timeline_id}"
-    await manager.connect(room, ws)
+    if not await manager.connect(room, ws, user_id=user_id):
+        return
 
     try:
         while True:
             msg = await ws.receive_json()
+            manager.touch(ws)
             action = msg.get("action", "chat")
-            payload = msg.get("payload", {})
-
-            # fetch data
-            goals = session.exec(select(Goal).where(Goal.user_id == user_id)).all()
-            timeline = session.get(Timeline, timeline_id)
-            contracts = session.exec(select(TemporalContract).where(TemporalContract.timeline_id == timeline_id)).all()
-
-            completed = sum(1 for g in goals if g.completed)
-            total = len(goals)
-            ratio = completed / max(1, total)
-
-            # prediction
-            pred = predict_failure(total, ratio)
-
-            # ✅ ignored warning logic:
-            # If user sends messages while having incomplete goals => timeline destabilizes
-            incomplete = total - completed
-            ignored_warnings = 0
-
-            if incomplete > 0:
-                # more incomplete goals => higher ignored warnings
-                ignored_warnings = min(5, 1 + incomplete // 3)
-
-            # ✅ update stability based on behavior
-            timeline.stability = update_stability(
-                current=timeline.stability,
-                ignored_warnings=ignored_warnings,
-                completed_tasks=completed,
-            )
-
-            # prison check
-            prison = session.exec(select(TimePrison).where(TimePrison.user_id == user_id)).first()
-            if prison is None:
-                prison = TimePrison(user_id=user_id, locked=False)
-
-            # lock if timeline unstable + prediction says high fail chance
-            if should_lock_prison(timeline.stability, pred.will_fail_probability):
-                prison.locked = True
-                prison.reason = "Future You has declared you a temporal liability."
-                prison.unlock_condition = "Complete at least 1 goal to restore the timeline."
-            else:
-                # unlock automatically if at least one task completed
-                if completed > 0:
-                    prison.locked = False
-                    prison.reason = ""
-                    prison.unlock_condition = ""
-
-            # persist
-            session.add(timeline)
-            session.add(prison)
-            session.commit()
-
-            # context for time-selves
-            context = {
-                "stability": timeline.stability,
-                "unfinished_goals": incomplete,
-                "open_contracts": len(contracts),
-                "prediction": pred.will_fail_probability,
-            }
-
-            # memory corruption increases as stability decreases
-            corruption = max(0.0, 1.0 - timeline.stability)
-
-            # simulate time selves
-            past_msg = simulate_time_self("PAST", context, corruption=corruption * 0.3)
-            present_msg = simulate_time_self("PRESENT", context, corruption=corruption * 0.1)
-            future_msg = simulate_time_self("FUTURE", context, corruption=corruption * 0.6)
-
-            await manager.broadcast(room, {
-                "type": "time_stream_update",
-                "timeline": {
-                    "id": timeline.id,
-                    "name": timeline.name,
-                    "stability": timeline.stability,
-                    "prediction_fail_prob": pred.will_fail_probability,
-                    "prediction_reason": pred.reason,
-                    "ignored_warnings": ignored_warnings,
-                    "incomplete_goals": incomplete,
-                },
-                "prison": {
-                    "locked": prison.locked,
-                    "reason": prison.reason,
-                    "unlock_condition": prison.unlock_condition,
-                },
-                "selves": [
-                    {"self": "PAST", "message": past_msg},
-                    {"self": "PRESENT", "message": present_msg},
-                    {"self": "FUTURE", "message": future_msg},
-                ],
-            })
+
+            # heartbeat frames only refresh last_seen
+            if action == "pong":
+                continue
+            if action == "ping":
+                manager.pong(ws)
+                continue
+            if action == "resync":
+                manager.resync(ws)
+                continue
+
+            # messages for the same room within the coalescing window share one tick
+            coalescer.submit((user_id, timeline_id), msg)
 
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(room, ws)
+        if room not in manager.rooms:
+            coalescer.forget((user_id, timeline_id))
+        await write_buffer.flush()
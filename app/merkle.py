@@ -0,0 +1,190 @@
+"""
+Optional Merkle accumulator over each timeline's contracts (MERKLE_ENABLED=1).
+
+The tree is a Merkle mountain range: leaf i is the i-th contract of the
+timeline (by id), two equal-height subtrees are merged as soon as both
+exist, and the root bags the remaining peaks right to left. Appending a
+contract only touches the O(log n) peaks kept in MerkleRoot, and proving
+that a contract belongs to the timeline needs its O(log n) siblings plus
+the peaks, instead of replaying the prev_hash chain.
+
+Hashes are domain separated so a leaf can't be passed off as an inner node:
+    leaf  = sha256(0x00 || contract_hash)
+    node  = sha256(0x01 || left || right)
+    bag   = sha256(0x02 || left_peak || right_bag)
+
+MerkleRoot.last_contract_id records the newest contract in the tree, and
+every append adds all of the timeline's contracts after it. So timelines
+that already have contracts get their tree built on the first append after
+the flag is switched on, and contracts appended while it was off are
+caught up when it is switched on again.
+"""
+import hashlib
+import json
+import os
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import MerkleNode, MerkleRoot, TemporalContract, utcnow
+
+MERKLE_ENABLED = os.getenv("MERKLE_ENABLED", "0") == "1"
+
+# (level, idx, hash)
+Peak = Tuple[int, int, str]
+
+
+def leaf_hash(contract_hash: str) -> str:
+    return hashlib.sha256(b"\x00" + contract_hash.encode("utf-8")).hexdigest()
+
+
+def node_hash(left: str, right: str) -> str:
+    return hashlib.sha256(b"\x01" + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def bag_peaks(peaks: Sequence[str]) -> str:
+    if not peaks:
+        return ""
+    acc = peaks[-1]
+    for peak in reversed(peaks[:-1]):
+        acc = hashlib.sha256(b"\x02" + bytes.fromhex(peak) + bytes.fromhex(acc)).hexdigest()
+    return acc
+
+
+def push_leaf(peaks: List[Peak], size: int, contract_hash: str) -> List[Peak]:
+    """Append leaf number `size` to peaks in place; returns every node created (leaf first)."""
+    created = [(0, size, leaf_hash(contract_hash))]
+    peaks.append(created[0])
+    while len(peaks) >= 2 and peaks[-1][0] == peaks[-2][0]:
+        right = peaks.pop()
+        left = peaks.pop()
+        parent = (left[0] + 1, left[1] // 2, node_hash(left[2], right[2]))
+        peaks.append(parent)
+        created.append(parent)
+    return created
+
+
+def _peak_for(size: int, index: int) -> Tuple[int, int, int]:
+    """(position among peaks, peak level, peak idx) of the subtree holding leaf `index`."""
+    start = 0
+    position = 0
+    for level in range(size.bit_length() - 1, -1, -1):
+        if size & (1 << level):
+            if index < start + (1 << level):
+                return position, level, start >> level
+            start += 1 << level
+            position += 1
+    raise IndexError(index)
+
+
+def verify_inclusion(contract_hash: str, proof: dict) -> bool:
+    """Check a proof from inclusion_proof() against the root it carries."""
+    acc = leaf_hash(contract_hash)
+    for step in proof["path"]:
+        acc = node_hash(step["hash"], acc) if step["side"] == "left" else node_hash(acc, step["hash"])
+    peaks = proof["peaks"]
+    return peaks[proof["peak_index"]] == acc and bag_peaks(peaks) == proof["root"]
+
+
+async def _root(session: AsyncSession, timeline_id: int) -> Optional[MerkleRoot]:
+    return (await session.exec(
+        select(MerkleRoot)
+        .where(MerkleRoot.timeline_id == timeline_id)
+        .execution_options(populate_existing=True)
+    )).first()
+
+
+async def append_leaves(
+    session: AsyncSession, timeline_id: int, contracts: Sequence[TemporalContract], after_id: int
+) -> MerkleRoot:
+    """
+    Extend the timeline's tree with freshly flushed contracts, which chain onto
+    contract `after_id`. Call inside the append transaction, after the chain
+    head swap, so appends are serialized.
+    """
+    root = await _root(session, timeline_id)
+    if root is None:
+        root = MerkleRoot(timeline_id=timeline_id)
+        session.add(root)
+    if root.last_contract_id == after_id:
+        # common case: nothing was appended behind the tree's back
+        leaves = [(c.id, c.contract_hash) for c in contracts]
+    else:
+        # first tree for this timeline, or contracts added while MERKLE_ENABLED was off: catch up
+        leaves = (await session.exec(
+            select(TemporalContract.id, TemporalContract.contract_hash)
+            .where(TemporalContract.timeline_id == timeline_id, TemporalContract.id > root.last_contract_id)
+            .order_by(TemporalContract.id)
+        )).all()
+
+    peaks: List[Peak] = [tuple(p) for p in json.loads(root.peaks_json)]
+    size = root.size
+    for contract_id, contract_hash in leaves:
+        for level, idx, digest in push_leaf(peaks, size, contract_hash):
+            session.add(MerkleNode(
+                timeline_id=timeline_id,
+                level=level,
+                idx=idx,
+                node_hash=digest,
+                contract_id=contract_id if level == 0 else None,
+            ))
+        size += 1
+
+    root.size = size
+    if leaves:
+        root.last_contract_id = leaves[-1][0]
+    root.peaks_json = json.dumps(peaks)
+    root.root = bag_peaks([p[2] for p in peaks])
+    root.updated_at = utcnow()
+    return root
+
+
+async def get_root(session: AsyncSession, timeline_id: int) -> Optional[dict]:
+    root = await _root(session, timeline_id)
+    if root is None:
+        return None
+    return {"timeline_id": timeline_id, "size": root.size, "root": root.root}
+
+
+async def inclusion_proof(session: AsyncSession, timeline_id: int, contract_id: int) -> Optional[dict]:
+    """Sibling path from the contract's leaf to its peak, plus all peaks; None if it isn't in the tree."""
+    leaf = (await session.exec(
+        select(MerkleNode).where(
+            MerkleNode.timeline_id == timeline_id,
+            MerkleNode.level == 0,
+            MerkleNode.contract_id == contract_id,
+        )
+    )).first()
+    root = await _root(session, timeline_id)
+    if leaf is None or root is None:
+        return None
+
+    position, peak_level, _ = _peak_for(root.size, leaf.idx)
+    wanted = [(level, (leaf.idx >> level) ^ 1) for level in range(peak_level)]
+    siblings = {}
+    if wanted:
+        rows = (await session.exec(
+            select(MerkleNode.level, MerkleNode.idx, MerkleNode.node_hash).where(
+                MerkleNode.timeline_id == timeline_id,
+                or_(*(and_(MerkleNode.level == level, MerkleNode.idx == idx) for level, idx in wanted)),
+            )
+        )).all()
+        siblings = {(level, idx): digest for level, idx, digest in rows}
+
+    contract_hash = (await session.get(TemporalContract, contract_id)).contract_hash
+    return {
+        "timeline_id": timeline_id,
+        "contract_id": contract_id,
+        "contract_hash": contract_hash,
+        "leaf_index": leaf.idx,
+        "size": root.size,
+        "root": root.root,
+        "path": [
+            {"side": "left" if idx % 2 == 0 else "right", "hash": siblings[(level, idx)]}
+            for level, idx in wanted
+        ],
+        "peaks": [p[2] for p in json.loads(root.peaks_json)],
+        "peak_index": position,
+    }
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 from typing import Optional
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
 
@@ -18,8 +19,14 @@ class User(SQLModel, table=True):
 
 
 class Goal(SQLModel, table=True):
+    # keyset pages of a user's goals, with and without the completed filter
+    __table_args__ = (
+        Index("ix_goal_user_id_id", "user_id", "id"),
+        Index("ix_goal_user_id_completed_id", "user_id", "completed", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(index=True)
+    user_id: int
     title: str
     description: str = ""
     created_at: datetime = Field(default_factory=utcnow)
@@ -28,8 +35,10 @@ class Goal(SQLModel, table=True):
 
 
 class Timeline(SQLModel, table=True):
+    __table_args__ = (Index("ix_timeline_user_id_id", "user_id", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(index=True)
+    user_id: int
     name: str = "prime"
     parent_timeline_id: Optional[int] = Field(default=None, index=True)
     stability: float = 1.0
@@ -47,9 +56,12 @@ class TimeSelfMemory(SQLModel, table=True):
 
 
 class TemporalContract(SQLModel, table=True):
+    # chain head lookups, ordered walks and keyset pages stay inside one index
+    __table_args__ = (Index("ix_temporalcontract_timeline_id_id", "timeline_id", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(index=True)
-    timeline_id: int = Field(index=True)
+    timeline_id: int
     contract_text: str
     created_at: datetime = Field(default_factory=utcnow)
 
@@ -64,3 +76,56 @@ class TimePrison(SQLModel, table=True):
     reason: str = ""
     unlock_condition: str = ""
     updated_at: datetime = Field(default_factory=utcnow)
+
+
+class GoalStats(SQLModel, table=True):
+    """per-user goal counters, kept in sync by the goals router"""
+    user_id: int = Field(primary_key=True)
+    total: int = 0
+    completed: int = 0
+
+    @property
+    def incomplete(self) -> int:
+        return self.total - self.completed
+
+
+class ContractChainHead(SQLModel, table=True):
+    """last contract on a timeline's chain; appends compare-and-swap on last_id"""
+    timeline_id: int = Field(primary_key=True)
+    last_id: int = 0
+    last_hash: str = ""
+    updated_at: datetime = Field(default_factory=utcnow)
+
+
+class ContractCheckpoint(SQLModel, table=True):
+    """how far a timeline's contract chain has been verified"""
+    timeline_id: int = Field(primary_key=True)
+    verified_up_to_id: int = 0
+    verified_hash: str = ""
+    updated_at: datetime = Field(default_factory=utcnow)
+
+
+class MerkleNode(SQLModel, table=True):
+    """node of a timeline's contract Merkle tree; level 0 holds one leaf per contract"""
+    timeline_id: int = Field(primary_key=True)
+    level: int = Field(primary_key=True)
+    idx: int = Field(primary_key=True)
+    node_hash: str
+    contract_id: Optional[int] = Field(default=None, index=True)
+
+
+class MerkleRoot(SQLModel, table=True):
+    """current root of a timeline's contract Merkle tree plus the peaks needed to extend it"""
+    timeline_id: int = Field(primary_key=True)
+    size: int = 0
+    last_contract_id: int = 0  # newest contract in the tree; appends add everything after it
+    root: str = ""
+    peaks_json: str = "[]"  # [[level, idx, hash], ...] left to right
+    updated_at: datetime = Field(default_factory=utcnow)
+
+
+class StabilityLease(SQLModel, table=True):
+    """scheduler shard claim; a worker decays the shard only if it moves due_at forward (compare-and-swap)"""
+    shard_lo: int = Field(primary_key=True)
+    owner: str = ""
+    due_at: float = 0.0  # unix seconds
@@ -0,0 +1,54 @@
+"""
+Keyset pagination for list endpoints.
+
+    GET /goals/1?limit=50                      first page, ordered by id
+    GET /goals/1?limit=50&after_id=<cursor>    next page
+    GET /contracts/7?order=desc&limit=20       newest first; after_id then means "older than"
+
+Responses stay plain JSON arrays; when more rows exist the cursor for the
+next page is in the X-Next-After-Id header. Pages seek on the id (composite
+indexes in app/models.py) instead of OFFSET, so page 1000 costs the same
+as page 1.
+"""
+import os
+from typing import Any, List, Literal, Optional, Sequence
+
+from fastapi import Query, Response
+
+LIST_DEFAULT_LIMIT = int(os.getenv("LIST_DEFAULT_LIMIT", "100"))
+LIST_MAX_LIMIT = int(os.getenv("LIST_MAX_LIMIT", "1000"))
+
+NEXT_CURSOR_HEADER = "X-Next-After-Id"
+
+
+class Page:
+    """Dependency holding after_id/limit/order from the query string."""
+
+    def __init__(
+        self,
+        after_id: Optional[int] = Query(None, ge=0),
+        limit: int = Query(LIST_DEFAULT_LIMIT, ge=1, le=LIST_MAX_LIMIT),
+        order: Literal["asc", "desc"] = "asc",
+    ) -> None:
+        self.after_id = after_id
+        self.limit = limit
+        self.order = order
+
+    def apply(self, query, id_column):
+        """Seek past the cursor and fetch one extra row to learn whether there is a next page."""
+        if self.order == "desc":
+            if self.after_id is not None:
+                query = query.where(id_column < self.after_id)
+            query = query.order_by(id_column.desc())
+        else:
+            if self.after_id is not None:
+                query = query.where(id_column > self.after_id)
+            query = query.order_by(id_column)
+        return query.limit(self.limit + 1)
+
+    def rows(self, response: Response, rows: Sequence[Any]) -> List[dict]:
+        """Rows of a projected select as dicts, setting the next-page header."""
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            response.headers[NEXT_CURSOR_HEADER] = str(rows[-1].id)
+        return [dict(row._mapping) for row in rows]
@@ -0,0 +1,113 @@
+"""
+Password hashing off the event loop, on its own small pool.
+
+bcrypt costs ~100-300 ms of CPU per call. Running it on Starlette's shared
+threadpool lets a login burst starve every other sync route, so hashing
+gets PASSWORD_HASH_WORKERS dedicated threads (bcrypt releases the GIL) and
+at most PASSWORD_HASH_MAX_PENDING calls queued or running; beyond that
+callers get HasherBusy, which the auth routes turn into 429 + Retry-After.
+Bulk hashing goes through the same queue in PASSWORD_HASH_CHUNK sized
+tasks, each password counted as pending.
+"""
+import asyncio
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from app.security import hash_password, verify_and_update
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+PASSWORD_HASH_CHUNK = int(os.getenv("PASSWORD_HASH_CHUNK", "4"))
+
+
+def _hash_all(passwords: Sequence[str]) -> List[str]:
+    return [hash_password(p) for p in passwords]
+
+
+class HasherBusy(Exception):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("password hashing is saturated")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING) -> None:
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.pending = 0
+        self.rejected = 0
+        # moving average of one hash, for Retry-After
+        self.avg_seconds = 0.25
+
+    async def _run(self, count: int, fn: Callable, *args):
+        if self.pending + count > self.max_pending:
+            self.rejected += 1
+            # time for the queue ahead of a retry to drain
+            raise HasherBusy(max(1, math.ceil(self.pending * self.avg_seconds / self.workers)))
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+
+        self.pending += count
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, self._timed, count, fn, *args)
+        finally:
+            self.pending -= count
+
+    def _timed(self, count: int, fn: Callable, *args):
+        started = time.monotonic()
+        try:
+            return fn(*args)
+        finally:
+            per_hash = (time.monotonic() - started) / max(1, count)
+            self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * per_hash
+
+    async def hash(self, password: str) -> str:
+        return await self._run(1, hash_password, password)
+
+    async def hash_many(self, passwords: Sequence[str]) -> List[str]:
+        """
+        Bulk imports: small chunks queued among the logins, at most workers - 1 at a
+        time so one worker stays free. HasherBusy if the queue fills up meanwhile.
+        """
+        chunk = max(1, min(PASSWORD_HASH_CHUNK, self.max_pending))
+        gate = asyncio.Semaphore(max(1, self.workers - 1))
+
+        async def run_chunk(part: List[str]) -> List[str]:
+            async with gate:
+                return await self._run(len(part), _hash_all, part)
+
+        tasks = [
+            asyncio.ensure_future(run_chunk(list(passwords[i:i + chunk])))
+            for i in range(0, len(passwords), chunk)
+        ]
+        try:
+            parts = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return [h for part in parts for h in part]
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        return await self._run(1, verify_and_update, password, hashed)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "avg_seconds": self.avg_seconds,
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,59 @@
+"""
+Versioned per-room state for the time stream.
+
+Ticks publish the full room state through the broker once; every worker
+keeps a RoomState mirror per room and turns each published state into a
+compact frame for its own sockets:
+
+    {"type": "time_stream_snapshot", "seq": n, "timeline": {...}, "prison": {...}, "selves": [...]}
+    {"type": "time_stream_delta", "seq": n, "changes": {"timeline": {"stability": 0.87}, "selves": [...]}}
+
+A snapshot goes out on connect, on {"action": "resync"} and to sockets that
+lost frames to the slow-consumer policy. Deltas only carry the top-level
+fields that changed; `timeline` and `prison` are diffed key by key, other
+fields are replaced whole. seq increases by one per delta, so a client that
+sees a gap should ask for a resync.
+"""
+from typing import Any, Dict, Optional
+
+SNAPSHOT_TYPE = "time_stream_snapshot"
+DELTA_TYPE = "time_stream_delta"
+
+# fields diffed key by key; everything else is compared whole
+NESTED_FIELDS = ("timeline", "prison")
+
+
+def diff_state(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Changed fields of `new` relative to `old`."""
+    changes: Dict[str, Any] = {}
+    for field, value in new.items():
+        before = old.get(field)
+        if field in NESTED_FIELDS and isinstance(before, dict) and isinstance(value, dict):
+            sub = {k: v for k, v in value.items() if before.get(k) != v}
+            if sub:
+                changes[field] = sub
+        elif before != value:
+            changes[field] = value
+    return changes
+
+
+class RoomState:
+    def __init__(self) -> None:
+        self.seq = 0
+        self.state: Dict[str, Any] = {}
+
+    def apply(self, new: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Take the new full state; returns the delta frame, or None if nothing changed."""
+        changes = diff_state(self.state, new)
+        if not changes:
+            return None
+        for field, value in changes.items():
+            if field in NESTED_FIELDS and isinstance(self.state.get(field), dict):
+                self.state[field] = {**self.state[field], **value}
+            else:
+                self.state[field] = value
+        self.seq += 1
+        return {"type": DELTA_TYPE, "seq": self.seq, "changes": changes}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"type": SNAPSHOT_TYPE, "seq": self.seq, **self.state}
@@ -1,27 +1,44 @@
+import os
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import insert, update
 from sqlalchemy.exc import IntegrityError
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.database import get_session
-from app.models import User, Timeline, TimePrison
-from app.schemas import RegisterRequest, TokenResponse
-from app.security import hash_password, verify_password, create_access_token
+from app.auth_tokens import bearer, require_admin, revoke
+from app.database import async_write_engine, get_async_session, get_write_session
+from app.etags import versions
+from app.models import GoalStats, User, Timeline, TimePrison
+from app.password_hasher import HasherBusy, password_hasher
+from app.schemas import RegisterBatchRequest, RegisterBatchResponse, RegisterRequest, TokenResponse
+from app.security import create_access_token, is_password_hash
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+AUTH_REGISTER_BATCH_MAX = int(os.getenv("AUTH_REGISTER_BATCH_MAX", "500"))
+
+
+def _busy(e: HasherBusy) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
 
 @router.post("/register", response_model=TokenResponse)
-def register(payload: RegisterRequest, session: Session = Depends(get_session)):
+async def register(payload: RegisterRequest, session: AsyncSession = Depends(get_write_session)):
     """
     Safe register:
     - Validates password length for bcrypt (<=72 bytes)
     - Prevents duplicate username crash
-    - Creates initial timeline + prison state
+    - Creates initial timeline + prison state in the same transaction
     """
 
-    # ✅ bcrypt safety validation
+    # ✅ bcrypt safety validation (CPU-bound, runs on the dedicated hashing pool)
     try:
-        hashed = hash_password(payload.password)
+        hashed = await password_hasher.hash(payload.password)
+    except HasherBusy as e:
+        raise _busy(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -29,45 +46,122 @@ def register(payload: RegisterRequest, session: Session = Depends(get_session)):
     session.add(user)
 
     try:
-        session.commit()
-        session.refresh(user)
+        # flush for user.id, then init timeline, prison and goal counters; one commit for all
+        await session.flush()
+        session.add(Timeline(user_id=user.id, name="prime", stability=1.0))
+        session.add(TimePrison(user_id=user.id, locked=False))
+        session.add(GoalStats(user_id=user.id))
+        await session.commit()
 
     except IntegrityError:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=400, detail="username already exists")
 
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"register failed: {str(e)}")
 
-    # init timeline + prison state
-    timeline = Timeline(user_id=user.id, name="prime", stability=1.0)
-    prison = TimePrison(user_id=user.id, locked=False)
+    # a poll of /prison/{id} before the user existed must not get a 304 now
+    versions.bump(("prison", user.id))
+    return TokenResponse(access_token=create_access_token(user.username), user_id=user.id)
+
+
+@router.post("/register/batch", response_model=RegisterBatchResponse, dependencies=[Depends(require_admin)])
+async def register_batch(payload: RegisterBatchRequest, session: AsyncSession = Depends(get_write_session)):
+    """
+    Bulk signup for migrations and load-test seeding:
+    - Each user gives a password, or an existing bcrypt hash as hashed_password
+    - Users, prime timelines, prisons and goal counters go in with one executemany each, in one transaction
+    - All or nothing: any duplicate username rejects the whole batch
+    - Admin only (ADMIN_TOKEN)
+    """
+    users = payload.users
+    if not users:
+        raise HTTPException(status_code=400, detail="users is empty")
+    if len(users) > AUTH_REGISTER_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"at most {AUTH_REGISTER_BATCH_MAX} users per batch")
+    if len({u.username for u in users}) != len(users):
+        raise HTTPException(status_code=400, detail="duplicate usernames in batch")
+    for u in users:
+        if u.hashed_password is None and u.password is None:
+            raise HTTPException(status_code=400, detail=f"{u.username}: password or hashed_password required")
+        if u.hashed_password is not None and not is_password_hash(u.hashed_password):
+            raise HTTPException(status_code=400, detail=f"{u.username}: unrecognized password hash")
+
+    try:
+        hashed = iter(await password_hasher.hash_many([u.password for u in users if u.hashed_password is None]))
+    except HasherBusy as e:
+        raise _busy(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # model_dump fills the Python-side defaults (created_at, stability, ...) that a Core insert would skip
+    user_rows = [
+        User(username=u.username, hashed_password=u.hashed_password or next(hashed)).model_dump(exclude={"id"})
+        for u in users
+    ]
+    try:
+        user_ids = (await session.execute(
+            insert(User).returning(User.id, sort_by_parameter_order=True), user_rows
+        )).scalars().all()
+        await session.execute(insert(Timeline), [
+            Timeline(user_id=uid, name="prime", stability=1.0).model_dump(exclude={"id"}) for uid in user_ids
+        ])
+        await session.execute(insert(TimePrison), [
+            TimePrison(user_id=uid, locked=False).model_dump(exclude={"id"}) for uid in user_ids
+        ])
+        await session.execute(insert(GoalStats), [GoalStats(user_id=uid).model_dump() for uid in user_ids])
+        await session.commit()
 
-    session.add(timeline)
-    session.add(prison)
-    session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=400, detail="username already exists")
 
-    return TokenResponse(access_token=create_access_token(user.username))
+    versions.bump(*(("prison", uid) for uid in user_ids))
+    return RegisterBatchResponse(created=len(user_ids), user_ids=user_ids)
 
 
 @router.post("/login", response_model=TokenResponse)
-def login(payload: RegisterRequest, session: Session = Depends(get_session)):
+async def login(payload: RegisterRequest, session: AsyncSession = Depends(get_async_session)):
     """
     Login:
     - Validates bcrypt safety
     - Returns JWT token
     """
-    user = session.exec(select(User).where(User.username == payload.username)).first()
+    user = (await session.exec(select(User).where(User.username == payload.username))).first()
+    # end the read transaction: nothing may hold the database while bcrypt runs
+    await session.commit()
     if not user:
         raise HTTPException(status_code=401, detail="invalid credentials")
 
     try:
-        ok = verify_password(payload.password, user.hashed_password)
+        ok, new_hash = await password_hasher.verify_and_update(payload.password, user.hashed_password)
+    except HasherBusy as e:
+        raise _busy(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
     if not ok:
         raise HTTPException(status_code=401, detail="invalid credentials")
 
-    return TokenResponse(access_token=create_access_token(user.username))
+    if new_hash:
+        # BCRYPT_ROUNDS changed since this hash was made; short write transaction, and only
+        # if the stored hash is still the one we verified (no concurrent password change)
+        async with AsyncSession(async_write_engine) as write_session:
+            await write_session.exec(
+                update(User)
+                .where(User.id == user.id, User.hashed_password == user.hashed_password)
+                .values(hashed_password=new_hash)
+            )
+            await write_session.commit()
+
+    return TokenResponse(access_token=create_access_token(user.username), user_id=user.id)
+
+
+@router.post("/logout")
+async def logout(creds: Optional[HTTPAuthorizationCredentials] = Depends(bearer)):
+    """Revoke the bearer token until it expires."""
+    if creds is None:
+        raise HTTPException(status_code=401, detail="not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    revoke(creds.credentials)
+    return {"ok": True}
@@ -1,47 +1,112 @@
-import hashlib
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
-from app.database import get_session
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.contract_chain import ChainConflict, append_contracts, verify_timeline
+from app.auth_tokens import authorize, owns
+from app.database import get_async_session, get_write_session
+from app.etags import conditional
+from app import merkle
 from app.models import TemporalContract, Timeline, User
-from app.schemas import ContractCreate
+from app.pagination import Page
+from app.schemas import ContractBatchCreate, ContractCreate
 
-router = APIRouter(prefix="/contracts", tags=["contracts"])
+router = APIRouter(prefix="/contracts", tags=["contracts"], dependencies=[Depends(authorize)])
 
+CONTRACT_BATCH_MAX = int(os.getenv("CONTRACT_BATCH_MAX", "500"))
 
-def compute_hash(text: str) -> str:
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
+async def _check_timeline(session: AsyncSession, caller: Optional[int], timeline_id: int) -> None:
+    """404 for another user's timeline (anonymous callers aren't checked, as with {user_id} paths)."""
+    if caller is None:
+        return
+    owner = (await session.exec(select(Timeline.user_id).where(Timeline.id == timeline_id))).first()
+    if owner is None or not owns(caller, owner):
+        raise HTTPException(404, "timeline not found")
 
-@router.post("/{user_id}/{timeline_id}")
-def make_contract(user_id: int, timeline_id: int, payload: ContractCreate, session: Session = Depends(get_session)):
-    user = session.get(User, user_id)
-    timeline = session.get(Timeline, timeline_id)
-    if not user or not timeline:
+
+async def _append(session: AsyncSession, user_id: int, timeline_id: int, texts: List[str]):
+    user = await session.get(User, user_id)
+    timeline = await session.get(Timeline, timeline_id)
+    if not user or not timeline or timeline.user_id != user_id:
         raise HTTPException(404, "invalid user/timeline")
+    try:
+        return await append_contracts(session, user_id, timeline_id, texts)
+    except ChainConflict as e:
+        raise HTTPException(409, str(e))
+
+
+@router.post("/{user_id}/{timeline_id}")
+async def make_contract(user_id: int, timeline_id: int, payload: ContractCreate, session: AsyncSession = Depends(get_write_session)):
+    return (await _append(session, user_id, timeline_id, [payload.contract_text]))[0]
+
 
-    last = session.exec(
-        select(TemporalContract)
-        .where(TemporalContract.timeline_id == timeline_id)
-        .order_by(TemporalContract.id.desc())
-    ).first()
-
-    prev_hash = last.contract_hash if last else ""
-    raw = f"{prev_hash}|{user_id}|{timeline_id}|{payload.contract_text}"
-    contract_hash = compute_hash(raw)
-
-    contract = TemporalContract(
-        user_id=user_id,
-        timeline_id=timeline_id,
-        contract_text=payload.contract_text,
-        prev_hash=prev_hash,
-        contract_hash=contract_hash,
-    )
-    session.add(contract)
-    session.commit()
-    session.refresh(contract)
-    return contract
+@router.post("/{user_id}/{timeline_id}/batch")
+async def make_contracts(user_id: int, timeline_id: int, payload: ContractBatchCreate, session: AsyncSession = Depends(get_write_session)):
+    """Chain several contracts in one transaction, in the order given."""
+    if not payload.contract_texts:
+        raise HTTPException(400, "contract_texts is empty")
+    if len(payload.contract_texts) > CONTRACT_BATCH_MAX:
+        raise HTTPException(400, f"at most {CONTRACT_BATCH_MAX} contracts per batch")
+    return await _append(session, user_id, timeline_id, payload.contract_texts)
+
+
+@router.get("/{timeline_id}/verify")
+async def verify_contracts(
+    timeline_id: int,
+    full: bool = False,
+    caller: Optional[int] = Depends(authorize),
+    session: AsyncSession = Depends(get_write_session),
+):
+    """Check contracts added since the last checkpoint; full=true rehashes the whole chain."""
+    await _check_timeline(session, caller, timeline_id)
+    return await verify_timeline(session, timeline_id, full=full)
+
+
+@router.get("/{timeline_id}/merkle/root")
+async def merkle_root(timeline_id: int, caller: Optional[int] = Depends(authorize), session: AsyncSession = Depends(get_async_session)):
+    if not merkle.MERKLE_ENABLED:
+        raise HTTPException(404, "merkle ledger disabled")
+    await _check_timeline(session, caller, timeline_id)
+    root = await merkle.get_root(session, timeline_id)
+    if root is None:
+        raise HTTPException(404, "no merkle tree for this timeline yet")
+    return root
+
+
+@router.get("/{timeline_id}/merkle/proof/{contract_id}")
+async def merkle_proof(
+    timeline_id: int,
+    contract_id: int,
+    caller: Optional[int] = Depends(authorize),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Inclusion proof for one contract; check it with app.merkle.verify_inclusion."""
+    if not merkle.MERKLE_ENABLED:
+        raise HTTPException(404, "merkle ledger disabled")
+    await _check_timeline(session, caller, timeline_id)
+    proof = await merkle.inclusion_proof(session, timeline_id, contract_id)
+    if proof is None:
+        raise HTTPException(404, "contract not in this timeline's merkle tree")
+    return proof
 
 
 @router.get("/{timeline_id}")
-def list_contracts(timeline_id: int, session: Session = Depends(get_session)):
-    return session.exec(select(TemporalContract).where(TemporalContract.timeline_id == timeline_id)).all()
+async def list_contracts(
+    timeline_id: int,
+    request: Request,
+    response: Response,
+    page: Page = Depends(),
+    caller: Optional[int] = Depends(authorize),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Keyset paginated (see app/pagination.py); ?order=desc for newest first."""
+    await _check_timeline(session, caller, timeline_id)
+    not_modified = conditional(request, response, ("contracts", timeline_id))
+    if not_modified is not None:
+        return not_modified
+
+    query = select(*TemporalContract.__table__.c).where(TemporalContract.timeline_id == timeline_id)
+    return page.rows(response, (await session.exec(page.apply(query, TemporalContract.id))).all())
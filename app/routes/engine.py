@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException
+
+from app.schemas import EngineBatchRequest
+from app.temporal_engine import batch_rng, predict_failure_batch, update_stability_batch, should_lock_prison_batch
+
+router = APIRouter(prefix="/engine", tags=["engine"])
+
+
+@router.post("/batch")
+def engine_batch(payload: EngineBatchRequest):
+    """
+    Score many timelines in one vectorized pass.
+    Element i of every list describes timeline i; with TEMPORAL_SEED the jitter is reproducible.
+    """
+    columns = [payload.goals_count, payload.completed_ratio, payload.stability, payload.ignored_warnings, payload.completed_tasks]
+    if len({len(c) for c in columns}) > 1:
+        raise HTTPException(400, "all input lists must have the same length")
+
+    fail_prob = predict_failure_batch(payload.goals_count, payload.completed_ratio)
+    stability = update_stability_batch(payload.stability, payload.ignored_warnings, payload.completed_tasks, rng=batch_rng())
+    lock = should_lock_prison_batch(stability, fail_prob)
+
+    return {
+        "fail_probability": fail_prob.tolist(),
+        "stability": stability.tolist(),
+        "lock": lock.tolist(),
+    }
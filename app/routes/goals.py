@@ -1,37 +1,80 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
-from app.database import get_session
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.auth_tokens import authorize, owns
+from app.database import get_async_session, get_write_session
+from app.etags import conditional, versions
+from app.goal_stats import bump_goal_stats, get_goal_stats
 from app.models import Goal, User
+from app.pagination import Page
 from app.schemas import GoalCreate
 
-router = APIRouter(prefix="/goals", tags=["goals"])
+router = APIRouter(prefix="/goals", tags=["goals"], dependencies=[Depends(authorize)])
 
 
 @router.post("/{user_id}")
-def create_goal(user_id: int, payload: GoalCreate, session: Session = Depends(get_session)):
-    user = session.get(User, user_id)
+async def create_goal(user_id: int, payload: GoalCreate, session: AsyncSession = Depends(get_write_session)):
+    user = await session.get(User, user_id)
     if not user:
         raise HTTPException(404, "user not found")
 
+    await bump_goal_stats(session, user_id, total=1)
     goal = Goal(user_id=user_id, title=payload.title, description=payload.description, due_date=payload.due_date)
     session.add(goal)
-    session.commit()
-    session.refresh(goal)
+    await session.commit()
+    await session.refresh(goal)
+    versions.bump(("goals", user_id))
     return goal
 
 
 @router.get("/{user_id}")
-def list_goals(user_id: int, session: Session = Depends(get_session)):
-    goals = session.exec(select(Goal).where(Goal.user_id == user_id)).all()
-    return goals
+async def list_goals(
+    user_id: int,
+    request: Request,
+    response: Response,
+    completed: Optional[bool] = None,
+    due_before: Optional[datetime] = None,
+    page: Page = Depends(),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Keyset paginated (see app/pagination.py), optionally filtered by completed / due_before."""
+    not_modified = conditional(request, response, ("goals", user_id))
+    if not_modified is not None:
+        return not_modified
+
+    query = select(*Goal.__table__.c).where(Goal.user_id == user_id)
+    if completed is not None:
+        query = query.where(Goal.completed == completed)
+    if due_before is not None:
+        query = query.where(Goal.due_date < due_before)
+    rows = (await session.exec(page.apply(query, Goal.id))).all()
+    return page.rows(response, rows)
 
 
 @router.patch("/{goal_id}/complete")
-def complete_goal(goal_id: int, session: Session = Depends(get_session)):
-    goal = session.get(Goal, goal_id)
-    if not goal:
+async def complete_goal(
+    goal_id: int,
+    caller: Optional[int] = Depends(authorize),
+    session: AsyncSession = Depends(get_write_session),
+):
+    goal = await session.get(Goal, goal_id)
+    if not goal or not owns(caller, goal.user_id):
         raise HTTPException(404, "goal not found")
-    goal.completed = True
-    session.add(goal)
-    session.commit()
+    user_id = goal.user_id
+
+    # backfill the counters before the update, or the backfill would already count it
+    await get_goal_stats(session, user_id)
+    # only the request that actually flips the flag counts it
+    flipped = await session.exec(
+        update(Goal).where(Goal.id == goal_id, Goal.completed == False).values(completed=True)  # noqa: E712
+    )
+    if flipped.rowcount == 1:
+        await bump_goal_stats(session, user_id, completed=1)
+    await session.commit()
+    if flipped.rowcount == 1:
+        versions.bump(("goals", user_id))
     return {"status": "completed"}
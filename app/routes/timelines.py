@@ -1,36 +1,50 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
+from typing import Optional
 
-from app.database import get_session
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.auth_tokens import authorize, owns
+from app.database import get_async_session, get_write_session
 from app.models import Timeline
+from app.pagination import Page
 from app.schemas import TimelineForkRequest
+from app.write_behind import write_buffer
 
-router = APIRouter(prefix="/timelines", tags=["timelines"])
+router = APIRouter(prefix="/timelines", tags=["timelines"], dependencies=[Depends(authorize)])
 
 
 @router.get("/{user_id}")
-def list_timelines(user_id: int, session: Session = Depends(get_session)):
+async def list_timelines(user_id: int, response: Response, page: Page = Depends(), session: AsyncSession = Depends(get_async_session)):
     """
-    ✅ Correct SQLModel query:
-    session.exec(select(Timeline).where(...)).all()
+    ✅ Column projection, keyset paginated (see app/pagination.py):
+    (await session.exec(select(*Timeline.__table__.c).where(...))).all()
     """
-    timelines = session.exec(select(Timeline).where(Timeline.user_id == user_id)).all()
+    query = select(*Timeline.__table__.c).where(Timeline.user_id == user_id)
+    timelines = page.rows(response, (await session.exec(page.apply(query, Timeline.id))).all())
+    for t in timelines:
+        t["stability"] = write_buffer.timeline_stability(t["id"], t["stability"])
     return timelines
 
 
 @router.post("/{timeline_id}/fork")
-def fork_timeline(timeline_id: int, payload: TimelineForkRequest, session: Session = Depends(get_session)):
-    base = session.get(Timeline, timeline_id)
-    if not base:
+async def fork_timeline(
+    timeline_id: int,
+    payload: TimelineForkRequest,
+    caller: Optional[int] = Depends(authorize),
+    session: AsyncSession = Depends(get_write_session),
+):
+    base = await session.get(Timeline, timeline_id)
+    if not base or not owns(caller, base.user_id):
         raise HTTPException(404, "timeline not found")
 
     forked = Timeline(
         user_id=base.user_id,
         parent_timeline_id=base.id,
         name=payload.new_name,
-        stability=base.stability * 0.9,
+        stability=write_buffer.timeline_stability(base.id, base.stability) * 0.9,
     )
     session.add(forked)
-    session.commit()
-    session.refresh(forked)
+    await session.commit()
+    await session.refresh(forked)
     return forked
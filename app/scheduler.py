@@ -0,0 +1,243 @@
+"""
+Background stability decay.
+
+Every STABILITY_TICK_SECONDS the scheduler walks all timelines in user_id
+range shards of STABILITY_SHARD_SIZE, applies the batch engine
+(update_stability / should_lock_prison) to each shard with one vectorized
+pass and writes the results back with executemany. Silent users decay and
+get locked into the time prison without anybody holding a socket open.
+
+Timelines/prisons with unflushed time-stream state are skipped: the live
+stream already owns them, and a stability write only lands if the row
+still holds the value the pass read.
+
+Workers coordinate through StabilityLease rows: before decaying a shard a
+worker moves its due_at forward with a compare-and-swap, so under
+`--workers N` (or several hosts) each shard is decayed once per interval
+whichever worker gets there first. All workers must use the same
+STABILITY_SHARD_SIZE. STABILITY_WORKER_INDEX / STABILITY_WORKER_COUNT
+still split shards statically on top of that.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.etags import versions
+from app.models import GoalStats, StabilityLease, Timeline, TimePrison, utcnow
+from app.temporal_engine import batch_rng, predict_failure_batch, update_stability_batch, should_lock_prison_batch
+from app.write_behind import WriteBehindBuffer
+
+STABILITY_TICK_SECONDS = float(os.getenv("STABILITY_TICK_SECONDS", "300"))  # 0 disables
+STABILITY_SHARD_SIZE = int(os.getenv("STABILITY_SHARD_SIZE", "1000"))
+STABILITY_WORKER_INDEX = int(os.getenv("STABILITY_WORKER_INDEX", "0"))
+STABILITY_WORKER_COUNT = int(os.getenv("STABILITY_WORKER_COUNT", "1"))
+
+LOCK_REASON = "Future You has declared you a temporal liability."
+LOCK_CONDITION = "Complete at least 1 goal to restore the timeline."
+
+logger = logging.getLogger(__name__)
+
+_timelines = Timeline.__table__
+_stats = GoalStats.__table__
+_prisons = TimePrison.__table__
+_leases = StabilityLease.__table__
+
+
+class StabilityScheduler:
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        buffer: WriteBehindBuffer,
+        interval: float = STABILITY_TICK_SECONDS,
+        shard_size: int = STABILITY_SHARD_SIZE,
+        worker_index: int = STABILITY_WORKER_INDEX,
+        worker_count: int = STABILITY_WORKER_COUNT,
+    ) -> None:
+        self.engine = engine
+        self.buffer = buffer
+        self.interval = interval
+        self.shard_size = shard_size
+        self.worker_index = worker_index
+        self.worker_count = max(1, worker_count)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._task: Optional[asyncio.Task] = None
+
+        # progress / lag
+        self.passes = 0
+        self.shards_total = 0
+        self.shards_done = 0
+        self.shards_skipped = 0
+        self.timelines_processed = 0
+        self.last_pass_started: Optional[float] = None
+        self.last_pass_seconds = 0.0
+        self.lag_seconds = 0.0
+
+    # ------------------------------------------------------------ lifecycle
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        due = time.monotonic() + self.interval
+        while True:
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+            # how far behind schedule this pass starts (non-zero when passes overrun the interval)
+            self.lag_seconds = max(0.0, time.monotonic() - due)
+            try:
+                await self.run_pass()
+            except Exception:
+                logger.exception("stability pass failed")
+            due += self.interval
+            if due < time.monotonic():
+                # skip missed ticks instead of running back-to-back passes
+                due = time.monotonic()
+
+    # ----------------------------------------------------------------- work
+    async def run_pass(self) -> int:
+        """One sweep over every shard owned by this worker; returns timelines updated."""
+        started = time.monotonic()
+        self.last_pass_started = time.time()
+
+        async with self.engine.connect() as conn:
+            max_user = (await conn.execute(select(func.max(_timelines.c.user_id)))).scalar() or 0
+
+        shards = [
+            lo for n, lo in enumerate(range(0, max_user + 1, self.shard_size))
+            if n % self.worker_count == self.worker_index
+        ]
+        self.shards_total = len(shards)
+        self.shards_done = 0
+        await self._seed_leases(shards)
+
+        updated = 0
+        for lo in shards:
+            updated += await self.process_shard(lo, lo + self.shard_size)
+            self.shards_done += 1
+            # let sockets and requests run between shards
+            await asyncio.sleep(0)
+
+        self.passes += 1
+        self.timelines_processed += updated
+        self.last_pass_seconds = time.monotonic() - started
+        return updated
+
+    async def _seed_leases(self, shards: list) -> None:
+        async with self.engine.connect() as conn:
+            known = set((await conn.execute(select(_leases.c.shard_lo))).scalars().all())
+        missing = [{"shard_lo": lo, "owner": "", "due_at": 0.0} for lo in shards if lo not in known]
+        if not missing:
+            return
+        try:
+            async with self.engine.begin() as conn:
+                await conn.execute(insert(_leases), missing)
+        except IntegrityError:
+            # another worker seeded them first
+            pass
+
+    async def _claim(self, conn, lo: int) -> bool:
+        """Take the shard for this interval unless another worker already did."""
+        now = time.time()
+        claimed = await conn.execute(
+            update(_leases)
+            .where(_leases.c.shard_lo == lo, _leases.c.due_at <= now)
+            # due a little early, so a pass that starts slightly ahead of schedule still claims it
+            .values(owner=self.owner, due_at=now + 0.9 * self.interval)
+        )
+        return claimed.rowcount == 1
+
+    async def process_shard(self, lo: int, hi: int) -> int:
+        async with self.engine.begin() as conn:
+            # same transaction as the decay: a failed shard releases its claim on rollback
+            if self.interval > 0 and not await self._claim(conn, lo):
+                self.shards_skipped += 1
+                return 0
+            rows = (await conn.execute(
+                select(
+                    _timelines.c.id,
+                    _timelines.c.user_id,
+                    _timelines.c.stability,
+                    func.coalesce(_stats.c.total, 0),
+                    func.coalesce(_stats.c.completed, 0),
+                )
+                .select_from(_timelines.outerjoin(_stats, _stats.c.user_id == _timelines.c.user_id))
+                .where(_timelines.c.user_id >= lo, _timelines.c.user_id < hi)
+            )).all()
+            rows = [r for r in rows if not self.buffer.is_dirty(r[0])]
+            if not rows:
+                return 0
+
+            ids, user_ids, stability, total, completed = (np.array(col) for col in zip(*rows))
+            incomplete = total - completed
+            ratio = completed / np.maximum(1, total)
+            fail_prob = predict_failure_batch(total, ratio)
+            warnings = np.where(incomplete > 0, np.minimum(5, 1 + incomplete // 3), 0)
+            new_stability = update_stability_batch(stability, warnings, completed, rng=batch_rng(self.passes, lo))
+            lock = should_lock_prison_batch(new_stability, fail_prob)
+
+            # compare-and-swap per row: a time-stream flush that landed since the read wins
+            await conn.execute(
+                update(_timelines)
+                .where(_timelines.c.id == bindparam("b_id"), _timelines.c.stability == bindparam("b_old"))
+                .values(stability=bindparam("b_stability")),
+                [
+                    {"b_id": int(i), "b_old": float(old), "b_stability": float(s)}
+                    for i, old, s in zip(ids, stability, new_stability)
+                ],
+            )
+
+            # prison is per user: lock if any of their timelines trips, otherwise unlock once they've completed something
+            lock_users = set(user_ids[lock].tolist())
+            unlock_users = set(user_ids[completed > 0].tolist()) - lock_users
+            lock_users = [u for u in lock_users if self.buffer.prison_state(u) is None]
+            unlock_users = [u for u in unlock_users if self.buffer.prison_state(u) is None]
+            now = utcnow()
+            changed = []
+            if lock_users:
+                changed += (await conn.execute(
+                    update(_prisons)
+                    .where(_prisons.c.user_id.in_(lock_users), _prisons.c.locked == False)  # noqa: E712
+                    .values(locked=True, reason=LOCK_REASON, unlock_condition=LOCK_CONDITION, updated_at=now)
+                    .returning(_prisons.c.user_id)
+                )).scalars().all()
+            if unlock_users:
+                changed += (await conn.execute(
+                    update(_prisons)
+                    .where(_prisons.c.user_id.in_(unlock_users), _prisons.c.locked == True)  # noqa: E712
+                    .values(locked=False, reason="", unlock_condition="", updated_at=now)
+                    .returning(_prisons.c.user_id)
+                )).scalars().all()
+        # after commit, so a client revalidating right away sees the new row
+        versions.bump(*(("prison", u) for u in changed))
+        return len(rows)
+
+    def metrics(self) -> dict:
+        return {
+            "interval": self.interval,
+            "running": self._task is not None,
+            "worker": f"{self.worker_index}/{self.worker_count}",
+            "passes": self.passes,
+            "shards_total": self.shards_total,
+            "shards_done": self.shards_done,
+            "shards_skipped": self.shards_skipped,
+            "timelines_processed": self.timelines_processed,
+            "last_pass_started": self.last_pass_started,
+            "last_pass_seconds": self.last_pass_seconds,
+            "lag_seconds": self.lag_seconds,
+        }
@@ -1,6 +1,10 @@
+import os
 from datetime import datetime
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+# timelines per POST /engine/batch
+ENGINE_BATCH_MAX = int(os.getenv("ENGINE_BATCH_MAX", "10000"))
 
 
 class RegisterRequest(BaseModel):
@@ -11,6 +15,22 @@ class RegisterRequest(BaseModel):
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    user_id: Optional[int] = None
+
+
+class RegisterBatchItem(BaseModel):
+    username: str
+    password: Optional[str] = None
+    hashed_password: Optional[str] = None  # existing bcrypt hash, for migrations
+
+
+class RegisterBatchRequest(BaseModel):
+    users: List[RegisterBatchItem]
+
+
+class RegisterBatchResponse(BaseModel):
+    created: int
+    user_ids: List[int]
 
 
 class GoalCreate(BaseModel):
@@ -23,5 +43,17 @@ class ContractCreate(BaseModel):
     contract_text: str
 
 
+class ContractBatchCreate(BaseModel):
+    contract_texts: List[str]
+
+
 class TimelineForkRequest(BaseModel):
     new_name: str
+
+
+class EngineBatchRequest(BaseModel):
+    goals_count: List[int] = Field(max_length=ENGINE_BATCH_MAX)
+    completed_ratio: List[float] = Field(max_length=ENGINE_BATCH_MAX)
+    stability: List[float] = Field(max_length=ENGINE_BATCH_MAX)
+    ignored_warnings: List[int] = Field(max_length=ENGINE_BATCH_MAX)
+    completed_tasks: List[int] = Field(max_length=ENGINE_BATCH_MAX)
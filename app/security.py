@@ -1,4 +1,6 @@
+import os
 from datetime import datetime, timedelta , timezone
+from typing import Optional, Tuple
 from jose import jwt
 from passlib.context import CryptContext
 
@@ -6,7 +8,16 @@ SECRET_KEY = "CHANGE_THIS_TO_REAL_SECRET"
 ALGO = "HS256"
 ACCESS_EXPIRE_MIN = 60 * 24
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost; hashes made with any other cost are rehashed on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 
 
 def hash_password(password: str) -> str:
@@ -17,6 +28,21 @@ def verify_password(password: str, hashed: str) -> bool:
     return pwd_context.verify(password, hashed)
 
 
+def verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """(matches, new hash if the stored one uses an outdated cost)"""
+    return pwd_context.verify_and_update(password, hashed)
+
+
+def decode_access_token(token: str) -> dict:
+    """Claims of a valid token; raises jose.JWTError (expired, bad signature, garbage)."""
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGO])
+
+
+def is_password_hash(hashed: str) -> bool:
+    """True for hashes pwd_context can verify (imported users)."""
+    return pwd_context.identify(hashed, required=False) is not None
+
+
 def create_access_token(sub: str) -> str:
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_EXPIRE_MIN)
     payload = {"sub": sub, "exp": expire}
@@ -1,7 +1,29 @@
 from __future__ import annotations
 from dataclasses import dataclass
+from typing import Optional
+import os
 import random
 
+import numpy as np
+
+# integer; set to make every tick reproducible: the RNG for a tick is derived from (seed, user, timeline, tick number)
+TEMPORAL_SEED = int(os.environ["TEMPORAL_SEED"]) if os.getenv("TEMPORAL_SEED") else None
+
+
+def tick_rng(user_id: int, timeline_id: int, tick: int) -> Optional[random.Random]:
+    """Per-room RNG for one tick, or None (module-level `random`) when no seed is configured."""
+    if TEMPORAL_SEED is None:
+        return None
+    # str seeds hash with sha512, so this is stable across processes and PYTHONHASHSEED
+    return random.Random(f"{TEMPORAL_SEED}:{user_id}:{timeline_id}:{tick}")
+
+
+def batch_rng(*keys: int) -> Optional[np.random.Generator]:
+    """NumPy counterpart of tick_rng for batch passes."""
+    if TEMPORAL_SEED is None:
+        return None
+    return np.random.default_rng([TEMPORAL_SEED, *keys])
+
 
 @dataclass
 class Prediction:
@@ -23,12 +45,37 @@ def predict_failure(goals_count: int, completed_ratio: float) -> Prediction:
     )
 
 
-def update_stability(current: float, ignored_warnings: int, completed_tasks: int) -> float:
+def update_stability(current: float, ignored_warnings: int, completed_tasks: int, rng: Optional[random.Random] = None) -> float:
     # ignoring future reduces stability, completing increases
     delta = completed_tasks * 0.05 - ignored_warnings * 0.08
-    new = max(0.0, min(1.0, current + delta + random.uniform(-0.02, 0.02)))
+    jitter = (rng or random).uniform(-0.02, 0.02)
+    new = max(0.0, min(1.0, current + delta + jitter))
     return new
 
 
 def should_lock_prison(stability: float, fail_prob: float) -> bool:
     return stability < 0.25 and fail_prob > 0.75
+
+
+# ---------------------------------------------------------------------------
+# Batch variants: same formulas over arrays, for re-scoring many timelines at once
+# ---------------------------------------------------------------------------
+
+def predict_failure_batch(goals_count, completed_ratio) -> np.ndarray:
+    """Vectorized predict_failure; returns the failure probabilities only."""
+    goals = np.asarray(goals_count, dtype=np.float64)
+    ratio = np.asarray(completed_ratio, dtype=np.float64)
+    return np.clip(0.2 + goals * 0.03 + (0.8 - ratio), 0.05, 0.95)
+
+
+def update_stability_batch(current, ignored_warnings, completed_tasks, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """Vectorized update_stability, with the same +-0.02 jitter per element."""
+    current = np.asarray(current, dtype=np.float64)
+    delta = np.asarray(completed_tasks, dtype=np.float64) * 0.05 - np.asarray(ignored_warnings, dtype=np.float64) * 0.08
+    rng = rng if rng is not None else np.random.default_rng()
+    noise = rng.uniform(-0.02, 0.02, size=current.shape)
+    return np.clip(current + delta + noise, 0.0, 1.0)
+
+
+def should_lock_prison_batch(stability, fail_prob) -> np.ndarray:
+    return (np.asarray(stability) < 0.25) & (np.asarray(fail_prob) > 0.75)
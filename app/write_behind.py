@@ -0,0 +1,159 @@
+"""
+Write-behind buffer for the time stream.
+
+Every chat message used to commit Timeline.stability and TimePrison straight
+away. Instead the stream records the latest state per key here and a
+background task writes everything in one transaction every
+WRITE_BEHIND_FLUSH_MS, or sooner once WRITE_BEHIND_MAX_PENDING keys are dirty.
+Readers overlay the buffered values on what they load, so the broadcast
+and the REST endpoints stay consistent before the flush lands.
+"""
+import asyncio
+import logging
+import os
+from typing import Dict, Optional
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.database import async_write_engine
+from app.models import Timeline, TimePrison, utcnow
+
+FLUSH_INTERVAL_MS = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "500"))
+FLUSH_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "1000"))
+
+logger = logging.getLogger(__name__)
+
+_timelines = Timeline.__table__
+_prisons = TimePrison.__table__
+
+
+class WriteBehindBuffer:
+    def __init__(self, engine: AsyncEngine, interval_ms: int = FLUSH_INTERVAL_MS, max_pending: int = FLUSH_MAX_PENDING) -> None:
+        self.engine = engine
+        self.interval = interval_ms / 1000
+        self.max_pending = max_pending
+
+        # timeline_id -> stability, user_id -> prison fields
+        self._timelines: Dict[int, float] = {}
+        self._prisons: Dict[int, dict] = {}
+        # snapshot currently being written, still visible to readers
+        self._inflight_timelines: Dict[int, float] = {}
+        self._inflight_prisons: Dict[int, dict] = {}
+
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+
+    # ---------------------------------------------------------------- writes
+    def put_timeline(self, timeline_id: int, stability: float) -> None:
+        self._timelines[timeline_id] = stability
+        self._maybe_wake()
+
+    def put_prison(self, user_id: int, locked: bool, reason: str, unlock_condition: str) -> None:
+        self._prisons[user_id] = {
+            "locked": locked,
+            "reason": reason,
+            "unlock_condition": unlock_condition,
+            "updated_at": utcnow(),
+        }
+        self._maybe_wake()
+
+    def _maybe_wake(self) -> None:
+        if len(self._timelines) + len(self._prisons) >= self.max_pending:
+            self._wake.set()
+
+    # ----------------------------------------------------------------- reads
+    def timeline_stability(self, timeline_id: int, default: float) -> float:
+        if timeline_id in self._timelines:
+            return self._timelines[timeline_id]
+        return self._inflight_timelines.get(timeline_id, default)
+
+    def prison_state(self, user_id: int) -> Optional[dict]:
+        if user_id in self._prisons:
+            return self._prisons[user_id]
+        return self._inflight_prisons.get(user_id)
+
+    def is_dirty(self, timeline_id: int) -> bool:
+        return timeline_id in self._timelines or timeline_id in self._inflight_timelines
+
+    # ----------------------------------------------------------------- flush
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._timelines and not self._prisons:
+                return
+            self._inflight_timelines, self._timelines = self._timelines, {}
+            self._inflight_prisons, self._prisons = self._prisons, {}
+            try:
+                await self._write(self._inflight_timelines, self._inflight_prisons)
+            except BaseException:
+                # keep anything newer that arrived meanwhile, retry the rest next time
+                self._timelines = {**self._inflight_timelines, **self._timelines}
+                self._prisons = {**self._inflight_prisons, **self._prisons}
+                raise
+            finally:
+                self._inflight_timelines = {}
+                self._inflight_prisons = {}
+            self.flushes += 1
+
+    async def _write(self, timelines: Dict[int, float], prisons: Dict[int, dict]) -> None:
+        async with self.engine.begin() as conn:
+            if timelines:
+                await conn.execute(
+                    update(_timelines)
+                    .where(_timelines.c.id == bindparam("b_id"))
+                    .values(stability=bindparam("b_stability")),
+                    [{"b_id": k, "b_stability": v} for k, v in timelines.items()],
+                )
+            if prisons:
+                existing = set((await conn.execute(
+                    select(_prisons.c.user_id).where(_prisons.c.user_id.in_(list(prisons)))
+                )).scalars())
+                updates = [{"b_user_id": uid, **state} for uid, state in prisons.items() if uid in existing]
+                inserts = [{"user_id": uid, **state} for uid, state in prisons.items() if uid not in existing]
+                if updates:
+                    await conn.execute(
+                        update(_prisons)
+                        .where(_prisons.c.user_id == bindparam("b_user_id"))
+                        .values(
+                            locked=bindparam("locked"),
+                            reason=bindparam("reason"),
+                            unlock_condition=bindparam("unlock_condition"),
+                            updated_at=bindparam("updated_at"),
+                        ),
+                        updates,
+                    )
+                if inserts:
+                    await conn.execute(insert(_prisons), inserts)
+
+    # ------------------------------------------------------------ lifecycle
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # usually transient (e.g. locked database); state was kept, next tick retries
+                logger.exception("write-behind flush failed, retrying on the next tick")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+write_buffer = WriteBehindBuffer(async_write_engine)
@@ -0,0 +1,276 @@
+"""
+Pub/sub transports that let several WSManager instances (uvicorn workers,
+hosts) share rooms.
+
+WSManager publishes each encoded frame once; the broker hands it back to
+every subscribed manager (including the publisher), which fans it out to
+its own sockets.
+
+    WS_BROKER_URL=memory://                 single process (default)
+    WS_BROKER_URL=redis://host:6379/0       Redis pub/sub (needs `redis`)
+    WS_BROKER_URL=unix:///tmp/tb-ws.sock    local hub, see `python -m app.ws_broker hub`
+"""
+import abc
+import asyncio
+import logging
+import os
+from typing import Callable, Dict, Optional, Set
+
+WS_BROKER_URL = os.getenv("WS_BROKER_URL", "memory://")
+# seconds between reconnect attempts after the redis / hub connection drops
+WS_BROKER_RECONNECT_SECONDS = float(os.getenv("WS_BROKER_RECONNECT_SECONDS", "1"))
+
+Deliver = Callable[[str, str], None]
+
+logger = logging.getLogger(__name__)
+
+
+class Broker(abc.ABC):
+    """Interface: publish(room, frame) ends up as deliver(room, frame) on every subscriber."""
+
+    def __init__(self) -> None:
+        self.deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self.deliver = deliver
+
+    def _dispatch(self, room: str, frame: str) -> None:
+        # a bad frame must not take the listener (and every room with it) down
+        try:
+            self.deliver(room, frame)
+        except Exception:
+            logger.exception("delivering a frame for %s failed", room)
+
+    @abc.abstractmethod
+    async def publish(self, room: str, frame: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def subscribe(self, room: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def unsubscribe(self, room: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def close(self) -> None:
+        ...
+
+
+class InMemoryBroker(Broker):
+    """Today's behavior: rooms only exist inside this process."""
+
+    async def publish(self, room: str, frame: str) -> None:
+        if self.deliver is not None:
+            self.deliver(room, frame)
+
+    async def subscribe(self, room: str) -> None:
+        pass
+
+    async def unsubscribe(self, room: str) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisBroker(Broker):
+    """
+    One Redis channel per room, one pubsub connection per process.
+
+    The listener starts with the first subscribe (get_message fails on a pubsub
+    that has no connection yet). If the connection drops it logs, waits
+    WS_BROKER_RECONNECT_SECONDS and resubscribes every room on a fresh one.
+    """
+
+    CHANNEL_PREFIX = "tb:ws:"
+    # never published to; keeps a resubscribed pubsub connected while no room is
+    SENTINEL = CHANNEL_PREFIX + "-"
+
+    def __init__(self, url: str) -> None:
+        super().__init__()
+        import redis.asyncio as redis
+
+        self.client = redis.Redis.from_url(url)
+        self.pubsub = self.client.pubsub()
+        self._rooms: Set[str] = set()
+        self._broken = False
+        self._listener: Optional[asyncio.Task] = None
+
+    async def _listen(self) -> None:
+        prefix = len(self.CHANNEL_PREFIX)
+        while True:
+            try:
+                if self._broken:
+                    await self._resubscribe()
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("redis pub/sub connection lost, reconnecting in %ss", WS_BROKER_RECONNECT_SECONDS)
+                self._broken = True
+                await asyncio.sleep(WS_BROKER_RECONNECT_SECONDS)
+                continue
+            if message is None or message["type"] != "message":
+                continue
+            room = message["channel"].decode("utf-8")[prefix:]
+            self._dispatch(room, message["data"].decode("utf-8"))
+
+    async def _resubscribe(self) -> None:
+        old, self.pubsub = self.pubsub, self.client.pubsub()
+        try:
+            await old.aclose()
+        except Exception:
+            pass
+        await self.pubsub.subscribe(self.SENTINEL, *(self.CHANNEL_PREFIX + room for room in self._rooms))
+        self._broken = False
+        logger.info("redis pub/sub reconnected, %d rooms", len(self._rooms))
+
+    async def publish(self, room: str, frame: str) -> None:
+        await self.client.publish(self.CHANNEL_PREFIX + room, frame)
+
+    async def subscribe(self, room: str) -> None:
+        # recorded first, so a reconnect picks the room up even if this subscribe fails
+        self._rooms.add(room)
+        await self.pubsub.subscribe(self.CHANNEL_PREFIX + room)
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def unsubscribe(self, room: str) -> None:
+        self._rooms.discard(room)
+        await self.pubsub.unsubscribe(self.CHANNEL_PREFIX + room)
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+# ---------------------------------------------------------------------------
+# Unix-socket hub: a dependency-free stand-in for Redis (tests, one-box multi-worker).
+# Line protocol, frames are compact JSON so they never contain a raw newline:
+#   client -> hub   SUB <room> | UNSUB <room> | PUB <room> <frame>
+#   hub -> client   MSG <room> <frame>
+# ---------------------------------------------------------------------------
+
+class UnixSocketBroker(Broker):
+    """Client of run_hub; reconnects and resubscribes like RedisBroker if the hub goes away."""
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._rooms: Set[str] = set()
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        await super().start(deliver)
+        await self._connect()
+        self._listener = asyncio.create_task(self._listen())
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+        for room in self._rooms:
+            self._writer.write(f"SUB {room}\n".encode("utf-8"))
+        await self._writer.drain()
+
+    async def _listen(self) -> None:
+        broken = False
+        while True:
+            try:
+                if broken:
+                    self._writer.close()
+                    await self._connect()
+                    broken = False
+                    logger.info("ws hub reconnected, %d rooms", len(self._rooms))
+                line = await self._reader.readline()
+                if not line:
+                    raise ConnectionError("hub closed the connection")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("ws hub connection lost, reconnecting in %ss", WS_BROKER_RECONNECT_SECONDS)
+                broken = True
+                await asyncio.sleep(WS_BROKER_RECONNECT_SECONDS)
+                continue
+            _, room, frame = line.decode("utf-8").rstrip("\n").split(" ", 2)
+            self._dispatch(room, frame)
+
+    async def _send(self, line: str) -> None:
+        self._writer.write((line + "\n").encode("utf-8"))
+        await self._writer.drain()
+
+    async def publish(self, room: str, frame: str) -> None:
+        await self._send(f"PUB {room} {frame}")
+
+    async def subscribe(self, room: str) -> None:
+        self._rooms.add(room)
+        await self._send(f"SUB {room}")
+
+    async def unsubscribe(self, room: str) -> None:
+        self._rooms.discard(room)
+        await self._send(f"UNSUB {room}")
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+
+async def run_hub(path: str) -> None:
+    """Fan PUB lines out to every client subscribed to the room."""
+    subscribers: Dict[str, Set[asyncio.StreamWriter]] = {}
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        mine: Set[str] = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                parts = line.decode("utf-8").rstrip("\n").split(" ", 2)
+                op, room = parts[0], parts[1]
+                if op == "SUB":
+                    subscribers.setdefault(room, set()).add(writer)
+                    mine.add(room)
+                elif op == "UNSUB":
+                    subscribers.get(room, set()).discard(writer)
+                    mine.discard(room)
+                elif op == "PUB":
+                    out = f"MSG {room} {parts[2]}\n".encode("utf-8")
+                    for w in list(subscribers.get(room, ())):
+                        w.write(out)
+        finally:
+            for room in mine:
+                subscribers.get(room, set()).discard(writer)
+            writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle, path=path)
+    async with server:
+        await server.serve_forever()
+
+
+def make_broker(url: str = WS_BROKER_URL) -> Broker:
+    if url.startswith("memory://"):
+        return InMemoryBroker()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBroker(url)
+    if url.startswith("unix://"):
+        return UnixSocketBroker(url[len("unix://"):])
+    raise ValueError(f"unsupported WS_BROKER_URL: {url}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local WebSocket pub/sub hub")
+    parser.add_argument("command", choices=["hub"])
+    parser.add_argument("path", nargs="?", default="/tmp/tb-ws.sock")
+    args = parser.parse_args()
+    asyncio.run(run_hub(args.path))
@@ -1,27 +1,327 @@
+import asyncio
+import os
+import time
 from fastapi import WebSocket
-from typing import Dict, List
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from app.json_codec import dumps, loads
+from app.room_state import RoomState
+from app.ws_broker import Broker, InMemoryBroker, make_broker
+
+# outbound frames buffered per socket before the slow-consumer policy kicks in
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "32"))
+# drop_oldest | coalesce (keep only the newest frame) | disconnect
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest")
+# 0 = unlimited
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "10000"))
+WS_MAX_CONNECTIONS_PER_USER = int(os.getenv("WS_MAX_CONNECTIONS_PER_USER", "8"))
+# seconds; a socket silent for WS_PING_INTERVAL gets a ping, one silent for WS_IDLE_TIMEOUT is evicted
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "60"))
+
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+# "try again later": sent when a cap is hit or a slow consumer is dropped
+CLOSE_TRY_AGAIN = 1013
+# "going away": sent to sockets the reaper evicts
+CLOSE_GOING_AWAY = 1001
+# "policy violation": handshake without a valid token
+CLOSE_POLICY_VIOLATION = 1008
+
+PING_FRAME = dumps({"type": "ping"})
+PONG_FRAME = dumps({"type": "pong"})
+
+# broker frames carrying full room state (see app/room_state.py) rather than a client frame
+STATE_PREFIX = "state:"
+
+
+class Connection:
+    """One socket plus the queue its writer task drains."""
+
+    def __init__(self, room: str, user_id: Optional[int], ws: WebSocket, maxsize: int) -> None:
+        self.room = room
+        self.user_id = user_id
+        self.ws = ws
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.queued_bytes = 0
+        self.writer: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.last_seen = time.monotonic()
+        self.last_ping = 0.0
+        # next state frame must be a full snapshot (just joined, asked to resync, or lost frames)
+        self.stale = False
+
+    def put(self, frame: str) -> None:
+        self.queue.put_nowait(frame)
+        self.queued_bytes += len(frame)
+
+    def take(self) -> str:
+        frame = self.queue.get_nowait()
+        self.queued_bytes -= len(frame)
+        return frame
 
 
 class WSManager:
-    def __init__(self) -> None:
-        self.rooms: Dict[str, List[WebSocket]] = {}
+    def __init__(
+        self,
+        queue_size: int = WS_SEND_QUEUE_SIZE,
+        policy: str = WS_SLOW_CONSUMER_POLICY,
+        broker: Optional[Broker] = None,
+        max_connections: int = WS_MAX_CONNECTIONS,
+        max_per_user: int = WS_MAX_CONNECTIONS_PER_USER,
+        ping_interval: float = WS_PING_INTERVAL,
+        idle_timeout: float = WS_IDLE_TIMEOUT,
+    ) -> None:
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"unknown slow consumer policy: {policy}")
+        self.queue_size = queue_size
+        self.policy = policy
+        self.broker = broker if broker is not None else make_broker()
+        self.max_connections = max_connections
+        self.max_per_user = max_per_user
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self._reaper: Optional[asyncio.Task] = None
+        # fire-and-forget unsubscribes / closes, referenced until done
+        self._background: Set[asyncio.Task] = set()
+
+        # room -> {ws: conn}; dicts keep insertion order and give O(1) add/remove
+        self.rooms: Dict[str, Dict[WebSocket, Connection]] = {}
+        self.connections: Dict[WebSocket, Connection] = {}
+        self.user_counts: Dict[int, int] = {}
+        # room -> state mirror, built from the states published to the room
+        self.states: Dict[str, RoomState] = {}
+        # broker rooms carrying server-side messages instead of socket frames
+        self.control: Dict[str, Callable[[str], None]] = {}
 
-    async def connect(self, room: str, ws: WebSocket):
+        self.rejected = 0
+        self.dropped = 0
+        self.slow_disconnects = 0
+        self.reaped = 0
+        self.snapshots = 0
+
+    async def start(self):
+        await self.broker.start(self._deliver)
+        if self.ping_interval > 0:
+            self._reaper = asyncio.create_task(self._reap_forever())
+
+    async def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        await self.broker.close()
+
+    def _spawn(self, coro: Awaitable) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def connect(self, room: str, ws: WebSocket, user_id: Optional[int] = None) -> bool:
+        """Accept and register the socket; returns False (socket closed) if a cap is hit."""
         await ws.accept()
-        self.rooms.setdefault(room, []).append(ws)
+
+        if self.max_connections and len(self.connections) >= self.max_connections:
+            return await self._reject(ws, "server connection limit reached")
+        if user_id is not None and self.max_per_user and self.user_counts.get(user_id, 0) >= self.max_per_user:
+            return await self._reject(ws, "per-user connection limit reached")
+
+        conn = Connection(room, user_id, ws, self.queue_size)
+        conn.writer = asyncio.create_task(self._writer(conn))
+        self.connections[ws] = conn
+        if user_id is not None:
+            self.user_counts[user_id] = self.user_counts.get(user_id, 0) + 1
+
+        members = self.rooms.get(room)
+        if members is None:
+            members = self.rooms[room] = {}
+            await self.broker.subscribe(room)
+        members[ws] = conn
+        self.resync(ws)
+        return True
+
+    def touch(self, ws: WebSocket):
+        """Record inbound activity (any client message, pongs included)."""
+        conn = self.connections.get(ws)
+        if conn is not None:
+            conn.last_seen = time.monotonic()
+
+    def pong(self, ws: WebSocket):
+        conn = self.connections.get(ws)
+        if conn is not None:
+            self._enqueue(conn, PONG_FRAME)
+
+    def resync(self, ws: WebSocket):
+        """Send the room snapshot now, or with the next state if the room has none yet."""
+        conn = self.connections.get(ws)
+        if conn is None:
+            return
+        state = self.states.get(conn.room)
+        if state is not None and state.seq:
+            self.snapshots += 1
+            self._enqueue(conn, dumps(state.snapshot()))
+        else:
+            conn.stale = True
+
+    async def _reject(self, ws: WebSocket, reason: str) -> bool:
+        self.rejected += 1
+        await self._close(ws, CLOSE_TRY_AGAIN, reason)
+        return False
 
     def disconnect(self, room: str, ws: WebSocket):
-        if room in self.rooms and ws in self.rooms[room]:
-            self.rooms[room].remove(ws)
+        conn = self.connections.pop(ws, None)
+        if conn is None:
+            return
 
-    async def broadcast(self, room: str, message: dict):
+        members = self.rooms.get(room)
+        if members is not None:
+            members.pop(ws, None)
+            if not members:
+                del self.rooms[room]
+                self.states.pop(room, None)
+                self._spawn(self._maybe_unsubscribe(room))
+
+        if conn.user_id is not None:
+            left = self.user_counts.get(conn.user_id, 1) - 1
+            if left > 0:
+                self.user_counts[conn.user_id] = left
+            else:
+                self.user_counts.pop(conn.user_id, None)
+
+        if conn.writer is not None and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+
+    async def _maybe_unsubscribe(self, room: str):
+        # a socket may have joined again before this task ran
         if room not in self.rooms:
+            await self.broker.unsubscribe(room)
+
+    async def broadcast(self, room: str, message: dict):
+        # encode once, the broker hands the frame to every worker that has sockets in the room
+        await self.broker.publish(room, dumps(message))
+
+    async def add_control_room(self, room: str, handler: Callable[[str], None]):
+        """Route broker frames for `room` to handler(frame) (cross-worker signals, no sockets involved)."""
+        self.control[room] = handler
+        await self.broker.subscribe(room)
+
+    async def publish_state(self, room: str, state: dict):
+        """Publish the full room state; each worker sends its sockets a delta or snapshot."""
+        if isinstance(self.broker, InMemoryBroker):
+            # nothing leaves the process, so skip the encode/decode round trip
+            members = self.rooms.get(room)
+            if members:
+                self._deliver_state(room, members, state)
+            return
+        await self.broker.publish(room, STATE_PREFIX + dumps(state))
+
+    def _deliver(self, room: str, frame: str):
+        handler = self.control.get(room)
+        if handler is not None:
+            handler(frame)
+            return
+        members = self.rooms.get(room)
+        if not members:
             return
-        dead = []
-        for ws in self.rooms[room]:
-            try:
-                await ws.send_json(message)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            self.disconnect(room, ws)
+        if frame.startswith(STATE_PREFIX):
+            self._deliver_state(room, members, loads(frame[len(STATE_PREFIX):]))
+            return
+        for conn in list(members.values()):
+            self._enqueue(conn, frame)
+
+    def _deliver_state(self, room: str, members: Dict[WebSocket, Connection], new_state: dict):
+        state = self.states.get(room)
+        if state is None:
+            state = self.states[room] = RoomState()
+        delta = state.apply(new_state)
+        delta_frame = dumps(delta) if delta is not None else None
+        snapshot_frame = None
+        for conn in list(members.values()):
+            if conn.stale:
+                if snapshot_frame is None:
+                    snapshot_frame = dumps(state.snapshot())
+                conn.stale = False
+                self.snapshots += 1
+                self._enqueue(conn, snapshot_frame)
+            elif delta_frame is not None:
+                self._enqueue(conn, delta_frame)
+
+    def _enqueue(self, conn: Connection, frame: str) -> None:
+        try:
+            conn.put(frame)
+            return
+        except asyncio.QueueFull:
+            conn.dropped += 1
+            self.dropped += 1
+            # the client may have missed a delta, resend the full state next time
+            conn.stale = True
+
+        if self.policy == "disconnect":
+            self.slow_disconnects += 1
+            self.disconnect(conn.room, conn.ws)
+            self._spawn(self._close(conn.ws, CLOSE_TRY_AGAIN, "too slow"))
+            return
+
+        if self.policy == "coalesce":
+            while not conn.queue.empty():
+                conn.take()
+        else:
+            conn.take()
+        conn.put(frame)
+
+    async def _writer(self, conn: Connection):
+        try:
+            while True:
+                frame = await conn.queue.get()
+                conn.queued_bytes -= len(frame)
+                await conn.ws.send_text(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # dead socket: the receive loop will see the disconnect, just stop sending
+            self.disconnect(conn.room, conn.ws)
+
+    async def _reap_forever(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            self.reap()
+
+    def reap(self):
+        """Evict idle or half-open sockets and ping quiet ones."""
+        now = time.monotonic()
+        for conn in list(self.connections.values()):
+            silent = now - conn.last_seen
+            if (self.idle_timeout and silent > self.idle_timeout) or (conn.writer is not None and conn.writer.done()):
+                self.reaped += 1
+                self.disconnect(conn.room, conn.ws)
+                self._spawn(self._close(conn.ws, CLOSE_GOING_AWAY, "idle timeout"))
+            elif silent >= self.ping_interval and now - conn.last_ping >= self.ping_interval:
+                conn.last_ping = now
+                self._enqueue(conn, PING_FRAME)
+
+    @staticmethod
+    async def _close(ws: WebSocket, code: int, reason: str = ""):
+        try:
+            await ws.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    def metrics(self) -> dict:
+        return {
+            "rooms": len(self.rooms),
+            "sockets": len(self.connections),
+            "users": len(self.user_counts),
+            "queued_frames": sum(c.queue.qsize() for c in self.connections.values()),
+            "queued_bytes": sum(c.queued_bytes for c in self.connections.values()),
+            "dropped_frames": self.dropped,
+            "slow_disconnects": self.slow_disconnects,
+            "rejected": self.rejected,
+            "reaped": self.reaped,
+            "state_rooms": len(self.states),
+            "snapshots": self.snapshots,
+            "policy": self.policy,
+            "max_connections": self.max_connections,
+            "max_per_user": self.max_per_user,
+            "ping_interval": self.ping_interval,
+            "idle_timeout": self.idle_timeout,
+        }
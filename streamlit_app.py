@@ -19,33 +19,55 @@ API_BASE = "http://127.0.0.1:8000"
 # ============================================================
 # API WRAPPERS
 # ============================================================
+def auth_headers() -> dict:
+    token = st.session_state.get("token")
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+
 def api_get(path: str) -> Any:
-    r = requests.get(f"{API_BASE}{path}", timeout=30)
+    # conditional GET: resend the last ETag, a 304 means our copy is still current
+    etag_cache = st.session_state.setdefault("etag_cache", {})
+    key = (path, st.session_state.get("token"))
+    headers = auth_headers()
+    cached = etag_cache.get(key)
+    if cached:
+        headers["If-None-Match"] = cached[0]
+
+    r = requests.get(f"{API_BASE}{path}", headers=headers, timeout=30)
+    if r.status_code == 304 and cached:
+        return cached[1]
     if r.status_code >= 400:
         raise RuntimeError(f"{r.status_code}: {r.text}")
-    return r.json()
+    data = r.json()
+    if r.headers.get("ETag"):
+        etag_cache[key] = (r.headers["ETag"], data)
+    return data
 
 
 def api_post(path: str, payload: dict) -> Any:
-    r = requests.post(f"{API_BASE}{path}", json=payload, timeout=30)
+    r = requests.post(f"{API_BASE}{path}", json=payload, headers=auth_headers(), timeout=30)
     if r.status_code >= 400:
         raise RuntimeError(f"{r.status_code}: {r.text}")
     return r.json()
 
 
 def api_patch(path: str) -> Any:
-    r = requests.patch(f"{API_BASE}{path}", timeout=30)
+    r = requests.patch(f"{API_BASE}{path}", headers=auth_headers(), timeout=30)
     if r.status_code >= 400:
         raise RuntimeError(f"{r.status_code}: {r.text}")
     return r.json()
 
 
-# ✅ CACHED GET (reduces backend spam)
+# ✅ CACHED GET (reduces backend spam); keyed by token too so a login doesn't reuse another user's responses
 @st.cache_data(ttl=3)
-def cached_get(path: str):
+def _cached_get(path: str, token: Any):
     return api_get(path)
 
 
+def cached_get(path: str):
+    return _cached_get(path, st.session_state.get("token"))
+
+
 # ============================================================
 # SESSION STATE INIT
 # ============================================================
@@ -68,6 +90,9 @@ def init_state():
         "timeline_state": {},
         "prison_state": {},
         "time_stream": [],
+        "partial_selves": {},  # self -> text streamed so far for the tick in progress
+        "etag_cache": {},      # (path, token) -> (etag, body) for conditional GETs
+        "state_seq": None,     # last time_stream_snapshot/delta seq applied
         "last_ws_message_ts": 0.0,
     }
     for k, v in defaults.items():
@@ -78,8 +103,11 @@ def init_state():
 # ============================================================
 # THREAD-SAFE WEBSOCKET WORKER (NO session_state inside)
 # ============================================================
-def ws_worker(user_id: int, timeline_id: int, inbox: Queue, outbox: Queue, stop_event: threading.Event):
+def ws_worker(user_id: int, timeline_id: int, token: Any, inbox: Queue, outbox: Queue, stop_event: threading.Event):
     ws_url = f"ws://127.0.0.1:8000/ws/time-stream/{user_id}/{timeline_id}"
+    if token:
+        # authenticated once at the handshake
+        ws_url += f"?token={token}"
 
     def on_open(ws):
         inbox.put({"type": "_status", "connected": True})
@@ -87,9 +115,13 @@ def ws_worker(user_id: int, timeline_id: int, inbox: Queue, outbox: Queue, stop_
     def on_message(ws, message: str):
         try:
             data = json.loads(message)
-            inbox.put(data)
         except Exception:
-            pass
+            return
+        # server heartbeat: answer so the reaper doesn't evict us
+        if data.get("type") == "ping":
+            ws.send(json.dumps({"action": "pong"}))
+            return
+        inbox.put(data)
 
     def on_close(ws, code, msg):
         inbox.put({"type": "_status", "connected": False})
@@ -140,6 +172,7 @@ def ensure_ws_running():
         args=(
             st.session_state.user_id,
             st.session_state.timeline_id,
+            st.session_state.token,
             st.session_state.ws_inbox,
             st.session_state.ws_outbox,
             st.session_state.ws_stop_event,
@@ -177,10 +210,36 @@ def consume_ws_messages() -> None:
             st.session_state.ws_connected = bool(msg.get("connected"))
             continue
 
-        if msg.get("type") == "time_stream_update":
+        if msg.get("type") == "time_self_delta":
+            partial = st.session_state.partial_selves
+            partial[msg.get("self", "?")] = partial.get(msg.get("self", "?"), "") + msg.get("chunk", "")
+            st.session_state.last_ws_message_ts = time.time()
+            continue
+
+        if msg.get("type") in ("time_stream_update", "time_stream_snapshot"):
             st.session_state.timeline_state = msg.get("timeline", {})
             st.session_state.prison_state = msg.get("prison", {})
             st.session_state.time_stream = msg.get("selves", [])
+            st.session_state.state_seq = msg.get("seq")
+            st.session_state.partial_selves = {}
+            st.session_state.last_ws_message_ts = time.time()
+            continue
+
+        if msg.get("type") == "time_stream_delta":
+            st.session_state.partial_selves = {}
+            seq = st.session_state.state_seq
+            if seq is None or msg.get("seq") != seq + 1:
+                # missed a frame: ask for a fresh snapshot instead of applying on top of stale state
+                st.session_state.ws_outbox.put({"action": "resync"})
+                continue
+            changes = msg.get("changes", {})
+            if "timeline" in changes:
+                st.session_state.timeline_state = {**st.session_state.timeline_state, **changes["timeline"]}
+            if "prison" in changes:
+                st.session_state.prison_state = {**st.session_state.prison_state, **changes["prison"]}
+            if "selves" in changes:
+                st.session_state.time_stream = changes["selves"]
+            st.session_state.state_seq = msg["seq"]
             st.session_state.last_ws_message_ts = time.time()
 
 
@@ -234,9 +293,11 @@ with st.sidebar:
                 out = api_post("/auth/register", {"username": u, "password": p})
                 st.success("Registered ✅")
                 st.session_state.token = out["access_token"]
+                st.session_state.user_id = out.get("user_id") or st.session_state.user_id
+                restart_ws()
 
                 # refresh timelines cache
-                cached_get.clear()
+                _cached_get.clear()
                 st.session_state.timelines = cached_get(f"/timelines/{st.session_state.user_id}")
 
             except Exception as e:
@@ -250,6 +311,9 @@ with st.sidebar:
                 out = api_post("/auth/login", {"username": u2, "password": p2})
                 st.success("Logged in ✅")
                 st.session_state.token = out["access_token"]
+                st.session_state.user_id = out.get("user_id") or st.session_state.user_id
+                _cached_get.clear()
+                restart_ws()
             except Exception as e:
                 st.error(str(e))
 
@@ -260,7 +324,7 @@ with st.sidebar:
 
     if st.button("Refresh timelines"):
         try:
-            cached_get.clear()
+            _cached_get.clear()
             st.session_state.timelines = cached_get(f"/timelines/{st.session_state.user_id}")
         except Exception as e:
             st.error(str(e))
@@ -319,6 +383,10 @@ with left:
     st.divider()
 
     selves = st.session_state.time_stream or []
+    partial = st.session_state.partial_selves
+    if partial:
+        # a tick is still streaming: show what has arrived so far
+        selves = [{"self": who, "message": partial.get(who, "")} for who in ("PAST", "PRESENT", "FUTURE") if who in partial]
     if not selves:
         st.info("No messages yet. Send a message to trigger time-stream update.")
     else:
@@ -350,7 +418,8 @@ with right:
     st.subheader("📌 Goals")
 
     try:
-        goals = cached_get(f"/goals/{st.session_state.user_id}")
+        # newest first: the first page is what fits on screen
+        goals = cached_get(f"/goals/{st.session_state.user_id}?order=desc")
     except Exception:
         goals = []
 
@@ -364,7 +433,7 @@ with right:
                 if st.button(f"Complete #{g['id']}", key=f"complete_{g['id']}"):
                     try:
                         api_patch(f"/goals/{g['id']}/complete")
-                        cached_get.clear()
+                        _cached_get.clear()
                         st.success("Goal completed ✅")
                         st.session_state.ws_outbox.put({"action": "chat", "payload": {"text": "Task completed"}})
                         st.rerun()
@@ -380,7 +449,7 @@ with right:
         if st.button("Create Goal"):
             try:
                 api_post(f"/goals/{st.session_state.user_id}", {"title": title, "description": desc})
-                cached_get.clear()
+                _cached_get.clear()
                 st.success("Created ✅")
                 st.rerun()
             except Exception as e:
@@ -390,12 +459,12 @@ with right:
     st.subheader("📜 Temporal Contracts")
 
     try:
-        contracts = cached_get(f"/contracts/{st.session_state.timeline_id}")
+        contracts = cached_get(f"/contracts/{st.session_state.timeline_id}?order=desc&limit=20")
     except Exception:
         contracts = []
 
     if contracts:
-        for c in contracts[::-1]:
+        for c in contracts:
             st.markdown(f"**Contract #{c['id']}**")
             st.code(c["contract_text"])
             st.caption(f"prev: {c['prev_hash'][:10]}...  hash: {c['contract_hash'][:10]}...")
@@ -411,7 +480,7 @@ with right:
                     f"/contracts/{st.session_state.user_id}/{st.session_state.timeline_id}",
                     {"contract_text": text},
                 )
-                cached_get.clear()
+                _cached_get.clear()
                 st.success("Contract sealed 🧾")
                 st.session_state.ws_outbox.put({"action": "chat", "payload": {"text": "Contract sealed"}})
                 st.rerun()
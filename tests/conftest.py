@@ -0,0 +1,63 @@
+import asyncio
+import itertools
+import os
+import tempfile
+
+# configuration is read at import time, so point the app at a scratch database before anything imports it
+_tmp = tempfile.mkdtemp(prefix="tb-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/app.db"
+os.environ["STABILITY_TICK_SECONDS"] = "0"
+os.environ["TIME_STREAM_WINDOW_MS"] = "0"
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["MERKLE_ENABLED"] = "1"
+os.environ["ADMIN_TOKEN"] = "test-admin"
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import SQLModel
+
+from app import models  # noqa: F401  (registers the tables)
+from app.database import _make_engines
+from app.main import app
+
+_usernames = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def user(client):
+    """A freshly registered user: {"id", "username", "timeline_id", "headers"}."""
+    name = f"user{next(_usernames)}"
+    r = client.post("/auth/register", json={"username": name, "password": "pw123456"})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    headers = {"Authorization": f"Bearer {body['access_token']}"}
+    timeline_id = client.get(f"/timelines/{body['user_id']}", headers=headers).json()[0]["id"]
+    return {"id": body["user_id"], "username": name, "timeline_id": timeline_id, "headers": headers}
+
+
+@pytest.fixture
+def run_db(tmp_path):
+    """
+    run_db(scenario) runs `await scenario(write_engine)` on an empty database
+    of its own, in a fresh event loop, with the app's SQLite profile.
+    """
+    def run(scenario):
+        sync_engine, aio_engine = _make_engines(f"sqlite:///{tmp_path}/unit.db")
+        SQLModel.metadata.create_all(sync_engine)
+        sync_engine.dispose()
+
+        async def main():
+            try:
+                return await scenario(aio_engine.execution_options(sqlite_begin="IMMEDIATE"))
+            finally:
+                await aio_engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
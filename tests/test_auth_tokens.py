@@ -0,0 +1,43 @@
+import time
+
+from app.auth_tokens import TokenCache
+
+
+def test_ttl_is_capped_by_the_token_exp():
+    cache = TokenCache(maxsize=10, ttl=300)
+    soon = time.time() + 5
+    cache.put("short", 1, soon)
+    cache.put("long", 2, time.time() + 3600)
+    assert cache._entries["short"][1] == soon
+    assert cache._entries["long"][1] <= time.time() + 300
+    cache.put("expired", 3, time.time() - 1)
+    assert cache.get("expired") is None
+    assert "expired" not in cache._entries
+    assert cache.get("short") == 1
+
+
+def test_least_recently_used_is_evicted():
+    cache = TokenCache(maxsize=2, ttl=300)
+    exp = time.time() + 3600
+    cache.put("a", 1, exp)
+    cache.put("b", 2, exp)
+    cache.get("a")
+    cache.put("c", 3, exp)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def test_revoked_token_is_401(client, user):
+    path = f"/goals/{user['id']}"
+    # cached by the first request, so logout has to evict it
+    assert client.get(path, headers=user["headers"]).status_code == 200
+    assert client.post("/auth/logout", headers=user["headers"]).json() == {"ok": True}
+    r = client.get(path, headers=user["headers"])
+    assert r.status_code == 401
+    assert r.json()["detail"] == "token revoked"
+
+
+def test_complete_someone_elses_goal_is_404(client, user):
+    other = client.post("/auth/register", json={"username": f"other-of-{user['id']}", "password": "pw123456"}).json()
+    goal = client.post(f"/goals/{user['id']}", json={"title": "x"}, headers=user["headers"]).json()
+    r = client.patch(f"/goals/{goal['id']}/complete", headers={"Authorization": f"Bearer {other['access_token']}"})
+    assert r.status_code == 404
@@ -0,0 +1,46 @@
+import asyncio
+
+from app import main
+from app.coalescer import TickCoalescer
+
+
+def test_messages_during_a_tick_fold_into_one_follow_up():
+    async def scenario():
+        batches = []
+        release = asyncio.Event()
+
+        async def tick(key, batch, tick_no):
+            batches.append((tick_no, [m["n"] for m in batch]))
+            await release.wait()
+
+        coalescer = TickCoalescer(tick, window_ms=0)
+        coalescer.submit("room", {"n": 0})
+        await asyncio.sleep(0)
+        for n in (1, 2, 3):
+            coalescer.submit("room", {"n": n})
+        release.set()
+        while coalescer._runners:
+            await asyncio.sleep(0)
+        return batches, coalescer.ticks, coalescer.messages
+
+    batches, ticks, messages = asyncio.run(scenario())
+    assert batches == [(0, [0]), (1, [1, 2, 3])]
+    assert (ticks, messages) == (2, 4)
+
+
+def test_ignored_warnings_scale_with_the_batch(client, user, monkeypatch):
+    for title in ("a", "b", "c"):
+        client.post(f"/goals/{user['id']}", json={"title": title}, headers=user["headers"])
+    seen = []
+    real = main.update_stability
+
+    def spy(**kwargs):
+        seen.append(kwargs["ignored_warnings"])
+        return real(**kwargs)
+
+    monkeypatch.setattr(main, "update_stability", spy)
+    key = (user["id"], user["timeline_id"])
+    client.portal.call(main.time_stream_tick, key, [{"message": "hi"}], 0)
+    client.portal.call(main.time_stream_tick, key, [{"message": "hi"}] * 3, 1)
+    # three incomplete goals: two warnings per folded message
+    assert seen == [2, 6]
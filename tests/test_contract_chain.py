@@ -0,0 +1,158 @@
+from types import SimpleNamespace
+
+from sqlalchemy import update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import contract_chain
+from app.contract_chain import append_contracts, link_hash, verify_all, verify_timeline
+from app.models import ContractChainHead, TemporalContract
+
+
+async def _append(engine, texts, timeline_id=1):
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        return await append_contracts(session, 1, timeline_id, texts)
+
+
+async def _chain(engine, timeline_id=1):
+    async with AsyncSession(engine) as session:
+        return (await session.exec(
+            select(TemporalContract).where(TemporalContract.timeline_id == timeline_id).order_by(TemporalContract.id)
+        )).all()
+
+
+def _assert_linked(contracts):
+    prev = ""
+    for c in contracts:
+        assert c.prev_hash == prev
+        assert c.contract_hash == link_hash(prev, c.user_id, c.timeline_id, c.contract_text)
+        prev = c.contract_hash
+
+
+def test_appends_link_onto_the_head(run_db):
+    async def scenario(engine):
+        await _append(engine, ["a"])
+        await _append(engine, ["b", "c"])
+        await _append(engine, ["other"], timeline_id=2)
+        return await _chain(engine), await _chain(engine, 2)
+
+    one, two = run_db(scenario)
+    assert [c.contract_text for c in one] == ["a", "b", "c"]
+    _assert_linked(one)
+    _assert_linked(two)
+
+
+def test_lost_head_race_relinks_on_the_new_head(run_db, monkeypatch):
+    real_chain_head = contract_chain._chain_head
+    raced = []
+
+    async def racing_chain_head(session, timeline_id):
+        head = await real_chain_head(session, timeline_id)
+        if raced:
+            return head
+        # another append lands after this one read the head
+        stale = SimpleNamespace(last_id=head.last_id, last_hash=head.last_hash)
+        raced.append(True)
+        await session.rollback()
+        await _append(session.bind, ["winner"])
+        await real_chain_head(session, timeline_id)
+        return stale
+
+    async def scenario(engine):
+        await _append(engine, ["first"])
+        monkeypatch.setattr(contract_chain, "_chain_head", racing_chain_head)
+        await _append(engine, ["loser"])
+        contracts = await _chain(engine)
+        async with AsyncSession(engine) as session:
+            head = await session.get(ContractChainHead, 1)
+        return contracts, head.last_id
+
+    contracts, head_id = run_db(scenario)
+    assert [c.contract_text for c in contracts] == ["first", "winner", "loser"]
+    _assert_linked(contracts)
+    assert head_id == contracts[-1].id
+
+
+def test_checkpoint_only_rehashes_new_contracts(run_db):
+    async def scenario(engine):
+        await _append(engine, ["a", "b", "c"])
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            first = await verify_timeline(session, 1)
+        await _append(engine, ["d", "e"])
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            second = await verify_timeline(session, 1)
+            third = await verify_timeline(session, 1)
+            full = await verify_timeline(session, 1, full=True)
+        return first, second, third, full
+
+    first, second, third, full = run_db(scenario)
+    assert (first["ok"], first["checked"]) == (True, 3)
+    assert (second["ok"], second["checked"]) == (True, 2)
+    assert second["verified_up_to_id"] > first["verified_up_to_id"]
+    assert third["checked"] == 0
+    assert (full["ok"], full["checked"]) == (True, 5)
+
+
+def test_tampering_is_reported(run_db):
+    async def scenario(engine):
+        contracts = await _append(engine, ["a", "b", "c"])
+        async with AsyncSession(engine) as session:
+            await session.exec(
+                update(TemporalContract).where(TemporalContract.id == contracts[1].id).values(contract_text="forged")
+            )
+            await session.commit()
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            report = await verify_timeline(session, 1, full=True)
+        return contracts, report
+
+    contracts, report = run_db(scenario)
+    assert not report["ok"]
+    assert report["broken"]["id"] == contracts[1].id
+    assert report["broken"]["reason"] == "contract_hash mismatch"
+    # the sound prefix still counts as verified
+    assert report["verified_up_to_id"] == contracts[0].id
+
+
+def test_verify_all_works_through_bounded_batches(run_db, monkeypatch):
+    monkeypatch.setattr(contract_chain, "CONTRACT_VERIFY_BATCH", 3)
+    monkeypatch.setattr(contract_chain, "CONTRACT_VERIFY_WORKERS", 2)
+    real_load = contract_chain._load
+    loaded = []
+
+    async def counting_load(session, timeline_id, full, limit=None):
+        checkpoint, links = await real_load(session, timeline_id, full, limit)
+        loaded.append(len(links))
+        return checkpoint, links
+
+    monkeypatch.setattr(contract_chain, "_load", counting_load)
+
+    async def scenario(engine):
+        await _append(engine, [f"long {n}" for n in range(7)], timeline_id=1)
+        await _append(engine, ["short"], timeline_id=2)
+        await _append(engine, ["pair", "pair"], timeline_id=3)
+        tampered = await _append(engine, [f"t{n}" for n in range(5)], timeline_id=4)
+        async with AsyncSession(engine) as session:
+            await session.exec(
+                update(TemporalContract).where(TemporalContract.id == tampered[3].id).values(contract_text="forged")
+            )
+            await session.commit()
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            first = await verify_all(session)
+        await _append(engine, ["one more"], timeline_id=1)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            again = await verify_all(session)
+            full = await verify_all(session, full=True)
+        return tampered, first, again, full
+
+    tampered, first, again, full = run_db(scenario)
+    by_id = lambda reports: {r["timeline_id"]: r for r in reports}  # noqa: E731
+    first, again, full = by_id(first), by_id(again), by_id(full)
+    assert max(loaded) == 3
+    assert {t: r["checked"] for t, r in first.items()} == {1: 7, 2: 1, 3: 2, 4: 4}
+    assert [t for t, r in first.items() if not r["ok"]] == [4]
+    assert first[4]["broken"]["id"] == tampered[3].id
+    assert first[4]["verified_up_to_id"] == tampered[2].id
+    # from the checkpoints: the new contract, and the broken one again
+    assert {t: r["checked"] for t, r in again.items()} == {1: 1, 2: 0, 3: 0, 4: 1}
+    assert {t: r["checked"] for t, r in full.items()} == {1: 8, 2: 1, 3: 2, 4: 4}
@@ -0,0 +1,20 @@
+import pytest
+from sqlalchemy import inspect
+
+from app.database import OBSOLETE_INDEXES, _make_engines, engine, init_db
+
+
+@pytest.mark.parametrize("url", ["sqlite://", "sqlite:///:memory:"])
+def test_in_memory_sqlite_is_rejected(url):
+    with pytest.raises(ValueError, match="in-memory"):
+        _make_engines(url)
+
+
+def test_init_db_drops_redundant_indexes(client):
+    # a database created before the composites still has the single-column index
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_temporalcontract_timeline_id ON temporalcontract (timeline_id)")
+    init_db()
+    names = {i["name"] for i in inspect(engine).get_indexes("temporalcontract")}
+    assert "ix_temporalcontract_timeline_id_id" in names
+    assert not names & set(OBSOLETE_INDEXES)
@@ -0,0 +1,94 @@
+from app.etags import VersionTable, _matches, versions, worker_count
+
+
+def test_if_none_match_comparison():
+    assert _matches('W/"abc.1"', 'W/"abc.1"')
+    assert _matches('"abc.1"', 'W/"abc.1"')
+    assert _matches('W/"x", W/"abc.1"', 'W/"abc.1"')
+    assert _matches("*", 'W/"abc.1"')
+    assert not _matches('W/"abc.2"', 'W/"abc.1"')
+    assert not _matches(None, 'W/"abc.1"')
+
+
+def test_tags_move_with_bumps_and_differ_by_process():
+    a, b = VersionTable(), VersionTable()
+    before = a.etag(("goals", 1))
+    assert a.etag(("goals", 1), "limit=5") != before
+    a.bump(("goals", 1))
+    assert a.etag(("goals", 1)) != before
+    assert a.etag(("goals", 2)) == a.etag(("goals", 2))
+    # a restarted process (new epoch) never reuses a tag
+    assert a.etag(("goals", 2)) != b.etag(("goals", 2))
+
+
+def test_remote_bumps_apply_once():
+    a = VersionTable()
+    before = a.etag(("prison", 1))
+    a.apply_remote('{"origin": "%s", "keys": [["prison", 1]]}' % a.epoch)
+    assert a.etag(("prison", 1)) == before
+    a.apply_remote('{"origin": "elsewhere", "keys": [["prison", 1]]}')
+    assert a.etag(("prison", 1)) != before
+
+
+def test_goals_304_until_a_write(client, user):
+    path, h = f"/goals/{user['id']}", user["headers"]
+    first = client.get(path, headers=h)
+    tag = first.headers["etag"]
+    assert first.headers["cache-control"] == "no-cache"
+
+    again = client.get(path, headers={**h, "If-None-Match": tag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == tag
+    # another page is another representation
+    assert client.get(path, params={"limit": 5}, headers={**h, "If-None-Match": tag}).status_code == 200
+
+    client.post(path, json={"title": "new"}, headers=h)
+    after = client.get(path, headers={**h, "If-None-Match": tag})
+    assert after.status_code == 200
+    assert [g["title"] for g in after.json()] == ["new"]
+
+
+def test_contracts_and_prison_tags(client, user):
+    h = user["headers"]
+    contracts = f"/contracts/{user['timeline_id']}"
+    tag = client.get(contracts, headers=h).headers["etag"]
+    assert client.get(contracts, headers={**h, "If-None-Match": tag}).status_code == 304
+    client.post(f"/contracts/{user['id']}/{user['timeline_id']}", json={"contract_text": "x"}, headers=h)
+    assert client.get(contracts, headers={**h, "If-None-Match": tag}).status_code == 200
+
+    prison = f"/prison/{user['id']}"
+    tag = client.get(prison, headers=h).headers["etag"]
+    assert client.get(prison, headers={**h, "If-None-Match": tag}).status_code == 304
+
+
+def test_prison_polled_before_register_is_not_304(client, user):
+    # ids are handed out in order, so the next registration gets user["id"] + 1
+    path = f"/prison/{user['id'] + 1}"
+    probe = client.get(path)
+    assert probe.json() is None
+    tag = probe.headers["etag"]
+    assert client.get(path, headers={"If-None-Match": tag}).status_code == 304
+
+    r = client.post("/auth/register", json={"username": f"next-after-{user['id']}", "password": "pw123456"})
+    assert r.json()["user_id"] == user["id"] + 1
+    fresh = client.get(path, headers={"If-None-Match": tag})
+    assert fresh.status_code == 200
+    assert fresh.json()["locked"] is False
+
+
+def test_worker_count_hints():
+    assert worker_count(["uvicorn", "app.main:app"], {}) == 1
+    assert worker_count(["uvicorn", "app.main:app", "--workers", "4"], {}) == 4
+    assert worker_count(["gunicorn", "-w", "3", "app.main:app"], {}) == 3
+    assert worker_count(["uvicorn", "--workers=2", "app.main:app"], {}) == 2
+    assert worker_count([], {"WEB_CONCURRENCY": "8"}) == 8
+    assert worker_count([], {"UVICORN_WORKERS": "x"}) == 1
+
+
+def test_disabled_versions_never_304(client, user, monkeypatch):
+    path, h = f"/goals/{user['id']}", user["headers"]
+    tag = client.get(path, headers=h).headers["etag"]
+    monkeypatch.setattr(versions, "enabled", False)
+    r = client.get(path, headers={**h, "If-None-Match": tag})
+    assert r.status_code == 200
+    assert "etag" not in r.headers
@@ -0,0 +1,106 @@
+import asyncio
+
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.database import engine
+from app.goal_stats import bump_goal_stats, get_goal_stats, rebuild_goal_stats
+from app.models import Goal, GoalStats
+from app.routes.goals import complete_goal
+
+
+def test_backfill_counts_existing_goals(run_db):
+    async def scenario(engine):
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            session.add_all([Goal(user_id=1, title="a"), Goal(user_id=1, title="b", completed=True), Goal(user_id=2, title="c")])
+            await session.commit()
+            stats = await get_goal_stats(session, 1)
+            await session.commit()
+            return stats.total, stats.completed, stats.incomplete
+
+    assert run_db(scenario) == (2, 1, 1)
+
+
+def test_bump_after_backfill_does_not_double_count(run_db):
+    async def scenario(engine):
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            session.add(Goal(user_id=1, title="a"))
+            await session.commit()
+            # the route order: bump first, then add the goal
+            await bump_goal_stats(session, 1, total=1)
+            session.add(Goal(user_id=1, title="b"))
+            await session.commit()
+            stats = await get_goal_stats(session, 1)
+            return stats.total, stats.completed
+
+    assert run_db(scenario) == (2, 0)
+
+
+def test_rebuild_matches_goal_table(run_db):
+    async def scenario(engine):
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            session.add_all([Goal(user_id=u, title="g", completed=(i % 2 == 0)) for u in (1, 2) for i in range(5)])
+            session.add(GoalStats(user_id=1, total=99, completed=99))
+            await session.commit()
+            users = await rebuild_goal_stats(session)
+            one = await get_goal_stats(session, 1)
+            two = await get_goal_stats(session, 2)
+            return users, (one.total, one.completed), (two.total, two.completed)
+
+    assert run_db(scenario) == (2, (5, 3), (5, 3))
+
+
+def test_concurrent_completes_count_once(run_db):
+    async def scenario(engine):
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            goal = Goal(user_id=1, title="a")
+            session.add(goal)
+            await session.commit()
+            goal_id = goal.id
+
+        async def complete():
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                return await complete_goal(goal_id, caller=None, session=session)
+
+        await asyncio.gather(*(complete() for _ in range(5)))
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            stats = await get_goal_stats(session, 1)
+            return stats.total, stats.completed
+
+    assert run_db(scenario) == (1, 1)
+
+
+def test_complete_twice_over_http(client, user):
+    goal = client.post(f"/goals/{user['id']}", json={"title": "x"}, headers=user["headers"]).json()
+    for _ in range(2):
+        r = client.patch(f"/goals/{goal['id']}/complete", headers=user["headers"])
+        assert r.json() == {"status": "completed"}
+    goals = client.get(f"/goals/{user['id']}", headers=user["headers"]).json()
+    assert [g["completed"] for g in goals] == [True]
+
+
+
+def test_register_creates_the_counters(client, user):
+    with Session(engine) as session:
+        stats = session.get(GoalStats, user["id"])
+    assert (stats.total, stats.completed) == (0, 0)
+
+
+def test_tick_backfills_a_legacy_user_outside_its_read(client, user):
+    for title in ("a", "b"):
+        client.post(f"/goals/{user['id']}", json={"title": title}, headers=user["headers"])
+    # a user from before the counters existed
+    with Session(engine) as session:
+        session.delete(session.get(GoalStats, user["id"]))
+        session.commit()
+
+    token = user["headers"]["Authorization"].split()[1]
+    with client.websocket_connect(f"/ws/time-stream/{user['id']}/{user['timeline_id']}?token={token}") as ws:
+        ws.send_json({"action": "chat", "message": "hi"})
+        frame = ws.receive_json()
+        while frame["type"] != "time_stream_snapshot":
+            frame = ws.receive_json()
+    assert frame["timeline"]["incomplete_goals"] == 2
+    with Session(engine) as session:
+        stats = session.get(GoalStats, user["id"])
+    assert (stats.total, stats.completed) == (2, 0)
@@ -0,0 +1,72 @@
+import asyncio
+import json
+import random
+
+import httpx
+
+from app.llm_simulator import HTTPProvider, generate_selves, simulate_time_self
+
+CONTEXT = {"stability": 0.5, "unfinished_goals": 2, "open_contracts": 0, "prediction": 0.4}
+
+
+async def _provider(handler, **kwargs) -> HTTPProvider:
+    provider = HTTPProvider("http://llm", **kwargs)
+    await provider.client.aclose()
+    provider.client = httpx.AsyncClient(base_url="http://llm", transport=httpx.MockTransport(handler))
+    return provider
+
+
+def test_concurrent_calls_share_one_batch():
+    posts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests = json.loads(request.content)["requests"]
+        posts.append((request.url.path, [r["self"] for r in requests]))
+        return httpx.Response(200, json={"outputs": [f"{r['self']} says hi" for r in requests]})
+
+    async def scenario():
+        provider = await _provider(handler, timeout=2, window_ms=20, max_batch=8)
+        selves = await generate_selves(provider, CONTEXT, 0.5)
+        await provider.close()
+        return selves, provider.batches, provider.fallbacks
+
+    selves, batches, fallbacks = asyncio.run(scenario())
+    assert posts == [("/generate_batch", ["PAST", "PRESENT", "FUTURE"])]
+    assert selves == {"PAST": "PAST says hi", "PRESENT": "PRESENT says hi", "FUTURE": "FUTURE says hi"}
+    assert (batches, fallbacks) == (1, 0)
+
+
+def test_a_full_batch_goes_out_without_waiting_for_the_window():
+    sizes = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests = json.loads(request.content)["requests"]
+        sizes.append(len(requests))
+        return httpx.Response(200, json={"outputs": ["ok"] * len(requests)})
+
+    async def scenario():
+        # a window the test would time out on, were it not cut short
+        provider = await _provider(handler, timeout=2, window_ms=60_000, max_batch=3)
+        texts = await asyncio.gather(*(provider.generate("PRESENT", CONTEXT) for _ in range(3)))
+        await provider.close()
+        return texts
+
+    assert asyncio.run(scenario()) == ["ok"] * 3
+    assert sizes == [3]
+
+
+def test_timeout_falls_back_to_the_simulator():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(1)
+        return httpx.Response(200, json={"outputs": ["too late"]})
+
+    async def scenario():
+        provider = await _provider(handler, timeout=0.05, window_ms=0, max_batch=8)
+        text = await provider.generate("FUTURE", CONTEXT, 0.2, random.Random(7))
+        fallbacks = provider.fallbacks
+        await provider.client.aclose()
+        return text, fallbacks
+
+    text, fallbacks = asyncio.run(scenario())
+    assert text == simulate_time_self("FUTURE", CONTEXT, 0.2, random.Random(7))
+    assert fallbacks == 1
@@ -0,0 +1,109 @@
+import pytest
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import merkle
+from app.contract_chain import append_contracts
+from app.merkle import bag_peaks, get_root, inclusion_proof, leaf_hash, node_hash, push_leaf, verify_inclusion
+
+
+def _naive_root(hashes):
+    """Reference MMR: split into perfect subtrees, largest first, and bag their roots."""
+    peaks, start = [], 0
+    for level in range(len(hashes).bit_length() - 1, -1, -1):
+        if len(hashes) & (1 << level):
+            layer = [leaf_hash(h) for h in hashes[start:start + (1 << level)]]
+            while len(layer) > 1:
+                layer = [node_hash(layer[i], layer[i + 1]) for i in range(0, len(layer), 2)]
+            peaks.append(layer[0])
+            start += 1 << level
+    return bag_peaks(peaks)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 8, 13])
+def test_push_leaf_matches_reference(size):
+    hashes = [f"{i:064x}" for i in range(size)]
+    peaks = []
+    for n, h in enumerate(hashes):
+        push_leaf(peaks, n, h)
+    assert bag_peaks([p[2] for p in peaks]) == _naive_root(hashes)
+
+
+async def _append(engine, texts, timeline_id=1):
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        return await append_contracts(session, 1, timeline_id, texts)
+
+
+async def _proofs(engine, contracts, timeline_id=1):
+    async with AsyncSession(engine) as session:
+        root = await get_root(session, timeline_id)
+        return root, [await inclusion_proof(session, timeline_id, c.id) for c in contracts]
+
+
+def test_every_contract_has_a_valid_proof(run_db, monkeypatch):
+    monkeypatch.setattr(merkle, "MERKLE_ENABLED", True)
+
+    async def scenario(engine):
+        contracts = []
+        for batch in (["a"], ["b", "c", "d"], ["e"], ["f", "g", "h", "i", "j", "k"]):
+            contracts += await _append(engine, batch)
+            # interleave another timeline so contract ids aren't contiguous
+            await _append(engine, ["noise"], timeline_id=2)
+        return contracts, await _proofs(engine, contracts)
+
+    contracts, (root, proofs) = run_db(scenario)
+    assert root["size"] == len(contracts)
+    assert root["root"] == _naive_root([c.contract_hash for c in contracts])
+    for contract, proof in zip(contracts, proofs):
+        assert proof["root"] == root["root"]
+        assert verify_inclusion(contract.contract_hash, proof)
+
+
+def test_forged_hash_fails_the_proof(run_db, monkeypatch):
+    monkeypatch.setattr(merkle, "MERKLE_ENABLED", True)
+
+    async def scenario(engine):
+        contracts = await _append(engine, ["a", "b", "c", "d", "e"])
+        return contracts, await _proofs(engine, contracts)
+
+    contracts, (_, proofs) = run_db(scenario)
+    assert not verify_inclusion(contracts[1].contract_hash, proofs[2])
+    assert not verify_inclusion("0" * 64, proofs[2])
+
+
+def test_contract_of_another_timeline_has_no_proof(run_db, monkeypatch):
+    monkeypatch.setattr(merkle, "MERKLE_ENABLED", True)
+
+    async def scenario(engine):
+        await _append(engine, ["a"])
+        other = await _append(engine, ["b"], timeline_id=2)
+        async with AsyncSession(engine) as session:
+            return await inclusion_proof(session, 1, other[0].id)
+
+    assert run_db(scenario) is None
+
+
+def test_reenabling_catches_up_on_contracts_added_while_off(run_db, monkeypatch):
+    async def scenario(engine):
+        monkeypatch.setattr(merkle, "MERKLE_ENABLED", False)
+        contracts = await _append(engine, ["before", "the", "flag"])
+        monkeypatch.setattr(merkle, "MERKLE_ENABLED", True)
+        contracts += await _append(engine, ["on"])
+        monkeypatch.setattr(merkle, "MERKLE_ENABLED", False)
+        contracts += await _append(engine, ["gap", "gap"])
+        monkeypatch.setattr(merkle, "MERKLE_ENABLED", True)
+        contracts += await _append(engine, ["on again"])
+        return contracts, await _proofs(engine, contracts)
+
+    contracts, (root, proofs) = run_db(scenario)
+    assert root["size"] == len(contracts) == 7
+    assert root["root"] == _naive_root([c.contract_hash for c in contracts])
+    assert all(verify_inclusion(c.contract_hash, p) for c, p in zip(contracts, proofs))
+
+
+def test_routes_read_the_flag_at_call_time(client, user, monkeypatch):
+    path = f"/contracts/{user['timeline_id']}/merkle/root"
+    client.post(f"/contracts/{user['id']}/{user['timeline_id']}", json={"contract_text": "x"}, headers=user["headers"])
+    assert client.get(path, headers=user["headers"]).status_code == 200
+    monkeypatch.setattr(merkle, "MERKLE_ENABLED", False)
+    r = client.get(path, headers=user["headers"])
+    assert (r.status_code, r.json()["detail"]) == (404, "merkle ledger disabled")
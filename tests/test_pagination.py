@@ -0,0 +1,65 @@
+from app.pagination import NEXT_CURSOR_HEADER
+
+
+def _walk(client, path, headers, **params):
+    """Follow X-Next-After-Id to the end; returns (pages, all rows)."""
+    pages, rows = 0, []
+    while True:
+        r = client.get(path, params=params, headers=headers)
+        assert r.status_code == 200, r.text
+        pages += 1
+        rows += r.json()
+        cursor = r.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return pages, rows
+        params["after_id"] = cursor
+
+
+def _goals(client, user, n):
+    return [
+        client.post(f"/goals/{user['id']}", json={"title": f"g{i}"}, headers=user["headers"]).json()["id"]
+        for i in range(n)
+    ]
+
+
+def test_cursor_walks_every_goal_once(client, user):
+    ids = _goals(client, user, 7)
+    pages, rows = _walk(client, f"/goals/{user['id']}", user["headers"], limit=3)
+    assert pages == 3
+    assert [g["id"] for g in rows] == ids
+
+
+def test_exact_multiple_has_no_empty_last_page(client, user):
+    _goals(client, user, 6)
+    pages, rows = _walk(client, f"/goals/{user['id']}", user["headers"], limit=3)
+    assert (pages, len(rows)) == (2, 6)
+
+
+def test_desc_order_starts_with_newest(client, user):
+    ids = _goals(client, user, 5)
+    pages, rows = _walk(client, f"/goals/{user['id']}", user["headers"], limit=2, order="desc")
+    assert pages == 3
+    assert [g["id"] for g in rows] == ids[::-1]
+
+
+def test_filters_apply_before_the_limit(client, user):
+    ids = _goals(client, user, 6)
+    for goal_id in ids[::2]:
+        client.patch(f"/goals/{goal_id}/complete", headers=user["headers"])
+    _, done = _walk(client, f"/goals/{user['id']}", user["headers"], limit=2, completed=True)
+    _, open_ = _walk(client, f"/goals/{user['id']}", user["headers"], limit=2, completed=False)
+    assert [g["id"] for g in done] == ids[::2]
+    assert [g["id"] for g in open_] == ids[1::2]
+
+
+def test_contracts_page_newest_first(client, user):
+    path = f"/contracts/{user['id']}/{user['timeline_id']}"
+    created = [client.post(path, json={"contract_text": f"c{i}"}, headers=user["headers"]).json()["id"] for i in range(5)]
+    r = client.get(f"/contracts/{user['timeline_id']}", params={"order": "desc", "limit": 2}, headers=user["headers"])
+    assert [c["id"] for c in r.json()] == created[:-3:-1]
+    assert r.headers[NEXT_CURSOR_HEADER] == str(created[-2])
+
+
+def test_limit_is_bounded(client, user):
+    r = client.get(f"/goals/{user['id']}", params={"limit": 0}, headers=user["headers"])
+    assert r.status_code == 422
@@ -0,0 +1,32 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.password_hasher import HasherBusy, PasswordHasher, password_hasher
+
+
+def test_rejects_past_max_pending():
+    async def scenario():
+        hasher = PasswordHasher(workers=1, max_pending=2)
+        release = threading.Event()
+        running = [asyncio.ensure_future(hasher._run(1, release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(HasherBusy) as busy:
+            await hasher.hash("pw123456")
+        release.set()
+        await asyncio.gather(*running)
+        hasher.close()
+        return busy.value.retry_after, hasher.rejected, hasher.pending
+
+    retry_after, rejected, pending = asyncio.run(scenario())
+    assert retry_after >= 1
+    assert (rejected, pending) == (1, 0)
+
+
+def test_saturated_hasher_is_429(client, user, monkeypatch):
+    monkeypatch.setattr(password_hasher, "pending", password_hasher.max_pending)
+    for path, username in (("/auth/register", "while-busy"), ("/auth/login", user["username"])):
+        r = client.post(path, json={"username": username, "password": "pw123456"})
+        assert r.status_code == 429
+        assert int(r.headers["retry-after"]) >= 1
@@ -0,0 +1,47 @@
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.models import GoalStats, Timeline, TimePrison, User
+
+ADMIN = {"Authorization": "Bearer test-admin"}
+
+
+def _batch(client, *names, headers=ADMIN):
+    users = [{"username": n, "password": "pw123456"} for n in names]
+    return client.post("/auth/register/batch", json={"users": users}, headers=headers)
+
+
+def test_batch_is_admin_only(client, user):
+    assert _batch(client, "anon-batch", headers={}).status_code == 403
+    assert _batch(client, "user-batch", headers=user["headers"]).status_code == 403
+
+
+def test_ids_line_up_with_timeline_and_prison_rows(client):
+    names = [f"batch-{i}" for i in range(5)]
+    r = _batch(client, *names)
+    assert r.status_code == 200, r.text
+    ids = r.json()["user_ids"]
+    assert r.json()["created"] == 5
+
+    with Session(engine) as session:
+        users = {u.id: u.username for u in session.exec(select(User).where(User.id.in_(ids)))}
+        timelines = session.exec(select(Timeline.user_id, Timeline.name).where(Timeline.user_id.in_(ids))).all()
+        prisons = session.exec(select(TimePrison.user_id).where(TimePrison.user_id.in_(ids))).all()
+        stats = session.exec(select(GoalStats.user_id).where(GoalStats.user_id.in_(ids))).all()
+    # returned in request order
+    assert [users[i] for i in ids] == names
+    assert sorted(timelines) == [(i, "prime") for i in ids]
+    assert sorted(prisons) == sorted(stats) == ids
+
+    login = client.post("/auth/login", json={"username": names[3], "password": "pw123456"})
+    assert login.json()["user_id"] == ids[3]
+
+
+def test_one_taken_username_rejects_the_whole_batch(client, user):
+    r = _batch(client, "fresh-a", user["username"], "fresh-b")
+    assert r.status_code == 400
+    assert r.json()["detail"] == "username already exists"
+    with Session(engine) as session:
+        assert session.exec(select(User).where(User.username.in_(["fresh-a", "fresh-b"]))).all() == []
+
+    assert _batch(client, "dup", "dup").json()["detail"] == "duplicate usernames in batch"
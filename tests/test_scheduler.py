@@ -0,0 +1,67 @@
+from sqlalchemy import event
+from sqlalchemy.sql import Update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import Timeline
+from app.scheduler import StabilityScheduler
+from app.write_behind import WriteBehindBuffer
+
+
+async def _timelines(engine, *stabilities):
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        timelines = [Timeline(user_id=u, stability=s) for u, s in enumerate(stabilities, 1)]
+        session.add_all(timelines)
+        await session.commit()
+        return [t.id for t in timelines]
+
+
+async def _stability(engine, timeline_id):
+    async with AsyncSession(engine) as session:
+        return (await session.get(Timeline, timeline_id)).stability
+
+
+def test_a_held_lease_skips_the_shard(run_db):
+    async def scenario(engine):
+        tid, = await _timelines(engine, 0.8)
+        first = StabilityScheduler(engine, WriteBehindBuffer(engine), interval=60, shard_size=100)
+        second = StabilityScheduler(engine, WriteBehindBuffer(engine), interval=60, shard_size=100)
+        second.owner = "other-worker"
+        done = await first.run_pass()
+        decayed = await _stability(engine, tid)
+        skipped = await second.run_pass()
+        return done, skipped, second.shards_skipped, decayed, await _stability(engine, tid)
+
+    done, skipped, shards_skipped, decayed, after = run_db(scenario)
+    assert (done, skipped, shards_skipped) == (1, 0, 1)
+    assert after == decayed
+
+
+def test_stability_cas_loses_to_a_concurrent_write(run_db):
+    async def scenario(engine):
+        raced, untouched = await _timelines(engine, 0.8, 0.8)
+
+        # a time-stream flush lands between the shard's read and its write-back
+        def flush_in_between(conn, clause, multiparams, params, options):
+            if isinstance(clause, Update) and clause.table.name == "timeline":
+                conn.exec_driver_sql("UPDATE timeline SET stability = 0.123 WHERE id = ?", (raced,))
+
+        event.listen(engine.sync_engine, "before_execute", flush_in_between)
+        scheduler = StabilityScheduler(engine, WriteBehindBuffer(engine), interval=0, shard_size=100)
+        await scheduler.run_pass()
+        event.remove(engine.sync_engine, "before_execute", flush_in_between)
+        return await _stability(engine, raced), await _stability(engine, untouched)
+
+    raced, untouched = run_db(scenario)
+    assert raced == 0.123
+    assert untouched != 0.8
+
+
+def test_dirty_timelines_are_left_to_the_stream(run_db):
+    async def scenario(engine):
+        tid, = await _timelines(engine, 0.8)
+        buffer = WriteBehindBuffer(engine)
+        buffer.put_timeline(tid, 0.5)
+        done = await StabilityScheduler(engine, buffer, interval=0, shard_size=100).run_pass()
+        return done, await _stability(engine, tid)
+
+    assert run_db(scenario) == (0, 0.8)
@@ -0,0 +1,26 @@
+from app import main
+
+
+def _tick_frames(client, user):
+    """Send one chat message and collect frames up to the tick's state frame."""
+    token = user["headers"]["Authorization"].split()[1]
+    with client.websocket_connect(f"/ws/time-stream/{user['id']}/{user['timeline_id']}?token={token}") as ws:
+        ws.send_json({"action": "chat", "message": "hi"})
+        frames = [ws.receive_json()]
+        while frames[-1]["type"] != "time_stream_snapshot":
+            frames.append(ws.receive_json())
+    return frames
+
+
+def test_streamed_selves_are_not_repeated_in_the_state(client, user):
+    frames = _tick_frames(client, user)
+    chunks = [f for f in frames if f["type"] == "time_self_delta"]
+    assert {f["self"] for f in chunks} == {"PAST", "PRESENT", "FUTURE"}
+    assert "selves" not in frames[-1]
+
+
+def test_unstreamed_selves_come_with_the_state(client, user, monkeypatch):
+    monkeypatch.setattr(main, "STREAM_SELVES", False)
+    frames = _tick_frames(client, user)
+    assert [f["type"] for f in frames] == ["time_stream_snapshot"]
+    assert [s["self"] for s in frames[-1]["selves"]] == ["PAST", "PRESENT", "FUTURE"]
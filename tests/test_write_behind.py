@@ -0,0 +1,91 @@
+import asyncio
+import logging
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import Timeline, TimePrison
+from app.write_behind import WriteBehindBuffer
+
+
+async def _timeline(engine, stability=1.0):
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        timeline = Timeline(user_id=1, stability=stability)
+        session.add(timeline)
+        await session.commit()
+        return timeline.id
+
+
+async def _stored(engine, timeline_id):
+    async with AsyncSession(engine) as session:
+        return (await session.get(Timeline, timeline_id)).stability
+
+
+def test_flush_writes_timelines_and_prisons(run_db):
+    async def scenario(engine):
+        tid = await _timeline(engine)
+        buffer = WriteBehindBuffer(engine)
+        buffer.put_timeline(tid, 0.5)
+        buffer.put_prison(1, True, "why", "how")
+        await buffer.flush()
+        async with AsyncSession(engine) as session:
+            prison = await session.get(TimePrison, 1)
+        return await _stored(engine, tid), prison.locked, buffer.is_dirty(tid), buffer.flushes
+
+    assert run_db(scenario) == (0.5, True, False, 1)
+
+
+def test_failed_flush_keeps_the_state_and_newer_values_win(run_db):
+    async def scenario(engine):
+        tid = await _timeline(engine)
+        buffer = WriteBehindBuffer(engine)
+        real_write = buffer._write
+        writing = asyncio.Event()
+        fail = asyncio.Event()
+
+        async def failing_write(timelines, prisons):
+            writing.set()
+            await fail.wait()
+            raise RuntimeError("database is locked")
+
+        buffer._write = failing_write
+        buffer.put_timeline(tid, 0.5)
+        flush = asyncio.create_task(buffer.flush())
+        await writing.wait()
+        # in flight: readers still see the value, and it still counts as dirty
+        during = buffer.timeline_stability(tid, 1.0), buffer.is_dirty(tid)
+        buffer.put_timeline(tid, 0.4)
+        fail.set()
+        try:
+            await flush
+        except RuntimeError:
+            pass
+        after_failure = buffer.timeline_stability(tid, 1.0), await _stored(engine, tid)
+
+        buffer._write = real_write
+        await buffer.flush()
+        return during, after_failure, await _stored(engine, tid), buffer.is_dirty(tid)
+
+    during, after_failure, stored, dirty = run_db(scenario)
+    assert during == (0.5, True)
+    assert after_failure == (0.4, 1.0)
+    assert stored == 0.4
+    assert not dirty
+
+
+def test_background_flush_failures_are_logged(run_db, caplog):
+    async def scenario(engine):
+        buffer = WriteBehindBuffer(engine, interval_ms=10)
+
+        async def failing_write(timelines, prisons):
+            raise RuntimeError("database is locked")
+
+        buffer._write = failing_write
+        buffer.put_timeline(1, 0.5)
+        buffer.start()
+        await asyncio.sleep(0.05)
+        buffer._task.cancel()
+        return buffer.timeline_stability(1, 1.0)
+
+    with caplog.at_level(logging.ERROR, logger="app.write_behind"):
+        assert run_db(scenario) == 0.5
+    assert "write-behind flush failed" in caplog.text
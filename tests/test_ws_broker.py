@@ -0,0 +1,113 @@
+import asyncio
+import itertools
+import json
+
+from app import ws_broker
+from app.ws_broker import UnixSocketBroker, run_hub
+from app.ws_manager import WSManager
+
+_probes = itertools.count()
+
+
+class RecordingSocket:
+    def __init__(self) -> None:
+        self.frames = []
+        # join probes, kept apart so other sockets joining the room don't show up in frames
+        self.probes = set()
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_text(self, frame: str) -> None:
+        frame = json.loads(frame)
+        if frame["type"] == "probe":
+            self.probes.add(frame["id"])
+        else:
+            self.frames.append(frame)
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        pass
+
+
+async def _until(check, timeout: float = 2.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not check():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+async def _join(manager, room, ws) -> None:
+    """Connect ws, and wait until the hub has the subscription (it handles each connection in order)."""
+    await manager.connect(room, ws)
+    await _probe(manager, room, ws)
+
+
+async def _probe(manager, room, ws) -> None:
+    probe = next(_probes)
+    await manager.broadcast(room, {"type": "probe", "id": probe})
+    await _until(lambda: probe in ws.probes)
+
+
+def _two_workers(tmp_path, scenario):
+    """Run scenario(one, two) with two WSManagers ("workers") sharing rooms through a hub."""
+    path = str(tmp_path / "hub.sock")
+
+    async def main():
+        hub = asyncio.create_task(run_hub(path))
+        await _until(lambda: (tmp_path / "hub.sock").exists())
+        one = WSManager(broker=UnixSocketBroker(path), ping_interval=0)
+        two = WSManager(broker=UnixSocketBroker(path), ping_interval=0)
+        await one.start()
+        await two.start()
+        try:
+            return await scenario(one, two)
+        finally:
+            await one.close()
+            await two.close()
+            # let the hub see both disconnects before it goes
+            await asyncio.sleep(0.05)
+            hub.cancel()
+
+    return asyncio.run(main())
+
+
+def test_frames_reach_sockets_on_the_other_worker(tmp_path):
+    async def scenario(one, two):
+        a, b, elsewhere = RecordingSocket(), RecordingSocket(), RecordingSocket()
+        await _join(one, "room", a)
+        await _join(two, "room", b)
+        await _join(two, "other", elsewhere)
+        await one.broadcast("room", {"type": "chat", "n": 1})
+        await _until(lambda: a.frames and b.frames)
+
+        await two.publish_state("room", {"timeline": {"stability": 0.5}})
+        await _until(lambda: len(a.frames) == 2 and len(b.frames) == 2)
+        return a.frames, b.frames, elsewhere.frames
+
+    a, b, elsewhere = _two_workers(tmp_path, scenario)
+    assert a[0] == b[0] == {"type": "chat", "n": 1}
+    # both just joined, so each worker sends its own socket a snapshot
+    assert a[1]["type"] == b[1]["type"] == "time_stream_snapshot"
+    assert a[1]["timeline"] == b[1]["timeline"] == {"stability": 0.5}
+    assert elsewhere == []
+
+
+def test_a_dropped_hub_connection_reconnects_and_resubscribes(tmp_path, monkeypatch):
+    monkeypatch.setattr(ws_broker, "WS_BROKER_RECONNECT_SECONDS", 0.01)
+
+    async def scenario(one, two):
+        a, b = RecordingSocket(), RecordingSocket()
+        await _join(one, "room", a)
+        await _join(two, "room", b)
+        old = two.broker._writer
+        old.close()
+        await _until(lambda: two.broker._writer is not old)
+        # the resubscribe went out first on the new connection, so this probe comes back once it is in
+        await _probe(two, "room", b)
+        await one.broadcast("room", {"type": "chat"})
+        await _until(lambda: b.frames)
+        return b.frames, two.broker._listener.done()
+
+    frames, listener_done = _two_workers(tmp_path, scenario)
+    assert frames == [{"type": "chat"}]
+    assert not listener_done
@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import pytest
+
+from app.ws_broker import InMemoryBroker
+from app.ws_manager import CLOSE_TRY_AGAIN, WSManager
+
+
+class StuckSocket:
+    """A client that never reads: send_text blocks, so frames pile up in the queue."""
+
+    def __init__(self) -> None:
+        self.closed = None
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_text(self, frame: str) -> None:
+        await asyncio.Event().wait()
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        self.closed = (code, reason)
+
+
+def _overflow(policy: str, frames: int):
+    """Connect a stuck socket with a 2-frame queue, enqueue `frames` frames, report what's left."""
+    async def scenario():
+        manager = WSManager(queue_size=2, policy=policy, broker=InMemoryBroker(), ping_interval=0)
+        await manager.start()
+        ws = StuckSocket()
+        assert await manager.connect("room", ws, user_id=1)
+        conn = manager.connections[ws]
+        for n in range(frames):
+            manager._enqueue(conn, f"f{n}")
+        queued = list(conn.queue._queue)
+        # let the background close run
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        result = {
+            "queued": queued,
+            "stale": conn.stale,
+            "dropped": manager.dropped,
+            "connected": ws in manager.connections,
+            "closed": ws.closed,
+            "slow_disconnects": manager.slow_disconnects,
+        }
+        manager.disconnect("room", ws)
+        await manager.close()
+        return result
+
+    return asyncio.run(scenario())
+
+
+def test_within_capacity_nothing_is_dropped():
+    r = _overflow("drop_oldest", 2)
+    assert r["queued"] == ["f0", "f1"]
+    assert r["dropped"] == 0
+
+
+def test_drop_oldest_keeps_the_newest_frames():
+    r = _overflow("drop_oldest", 5)
+    assert r["queued"] == ["f3", "f4"]
+    assert r["dropped"] == 3
+    # a delta may be gone: the next state frame must be a snapshot
+    assert r["stale"]
+    assert r["connected"]
+
+
+def test_coalesce_keeps_only_the_latest_frame():
+    r = _overflow("coalesce", 5)
+    assert r["queued"] == ["f4"]
+    assert r["stale"]
+
+
+def test_disconnect_closes_the_slow_socket():
+    r = _overflow("disconnect", 3)
+    assert not r["connected"]
+    assert r["closed"] == (CLOSE_TRY_AGAIN, "too slow")
+    assert r["slow_disconnects"] == 1
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        WSManager(policy="shrug", broker=InMemoryBroker())
+
+
+class RecordingSocket(StuckSocket):
+    def __init__(self) -> None:
+        super().__init__()
+        self.frames = []
+
+    async def send_text(self, frame: str) -> None:
+        self.frames.append(frame)
+
+
+def test_in_process_state_skips_the_broker():
+    async def scenario():
+        broker = InMemoryBroker()
+        manager = WSManager(broker=broker, ping_interval=0)
+        await manager.start()
+
+        async def publish(room, frame):
+            raise AssertionError("state went through the broker")
+
+        broker.publish = publish
+        ws = RecordingSocket()
+        await manager.connect("room", ws)
+        await manager.publish_state("room", {"timeline": {"stability": 0.5}})
+        await manager.publish_state("room", {"timeline": {"stability": 0.4}})
+        await asyncio.sleep(0)
+        manager.disconnect("room", ws)
+        await manager.close()
+        return [json.loads(f) for f in ws.frames]
+
+    snapshot, delta = asyncio.run(scenario())
+    assert snapshot == {"type": "time_stream_snapshot", "seq": 1, "timeline": {"stability": 0.5}}
+    assert delta == {"type": "time_stream_delta", "seq": 2, "changes": {"timeline": {"stability": 0.4}}}